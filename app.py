@@ -1,11 +1,14 @@
 # app.py (Streamlit UI) with debug logs
+import threading
 import streamlit as st
-from core.db import supabase
-from core.scraper import scrape_page
-from core.utils import get_text_hash
-from core.analyzer import llm_analyze_change
-from core.notifier import send_alert
-from datetime import datetime
+from core.db import get_supabase, iter_rows
+from datetime import datetime, timedelta
+
+FEED_PAGE_SIZE = 20
+REGION_HELP = (
+    'CSS selector such as "#notices", or XPath starting with "/" or "xpath:". '
+    "Only this part of the page is monitored."
+)
 
 # ==============================
 # Streamlit Config
@@ -14,13 +17,169 @@ st.set_page_config(page_title="Admissions Watch Pro", layout="wide")
 st.title("🇵🇰 Admissions Watch Pro")
 
 # --- Session state for safe reruns ---
-if 'scan_trigger' not in st.session_state:
-    st.session_state.scan_trigger = False
+if 'feed_page' not in st.session_state:
+    st.session_state.feed_page = 0
+if 'seen_scan' not in st.session_state:
+    st.session_state.seen_scan = None
+
+# ==============================
+# Cached queries (cleared on every write)
+# ==============================
+@st.cache_data(ttl=60, show_spinner=False)
+def load_feed(page: int, unread_only: bool, page_id, date_from, date_to) -> tuple[list, int]:
+    """One page of the feed plus the total number of matching changes."""
+    q = get_supabase().table("detected_changes").select(
+        "id, page_id, title, summary, url, timestamp, is_read", count="exact"
+    ).eq("is_meaningful", True)
+    if unread_only:
+        q = q.eq("is_read", False)
+    if page_id is not None:
+        q = q.eq("page_id", page_id)
+    if date_from:
+        q = q.gte("timestamp", date_from.isoformat())
+    if date_to:
+        q = q.lt("timestamp", (date_to + timedelta(days=1)).isoformat())
+
+    start = page * FEED_PAGE_SIZE
+    res = q.order("timestamp", desc=True).range(start, start + FEED_PAGE_SIZE - 1).execute()
+    print(f"📰 Feed page {page} loaded ({len(res.data or [])} of {res.count})")
+    return res.data or [], res.count or 0
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_sources() -> list:
+    sources = get_supabase().table("monitored_pages").select("id, name, url, region_selector").order("name").execute().data or []
+    print(f"📌 Loaded {len(sources)} sources")
+    return sources
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_subscribers() -> list:
+    subs = get_supabase().table("email_subscribers").select("email").execute().data or []
+    print(f"📬 Loaded {len(subs)} subscribers")
+    return subs
+
+def invalidate(*loaders):
+    for loader in loaders:
+        loader.clear()
+
+# ==============================
+# Background scan
+# ==============================
+class ScanJob:
+    """Progress of one dashboard scan, shared between the scan thread and every session."""
+
+    def __init__(self):
+        self.started_at = datetime.now()
+        self.finished_at = None
+        self.total = 0
+        self.done = 0
+        self.current = ""
+        self.messages = []
+        self.error = None
+
+    @property
+    def running(self) -> bool:
+        return self.finished_at is None
+
+@st.cache_resource
+def scan_state() -> dict:
+    # One scan at a time per server process
+    return {"job": None, "lock": threading.Lock()}
 
-def trigger_scan():
-    st.session_state.scan_trigger = not st.session_state.scan_trigger
+def start_scan():
+    state = scan_state()
+    with state["lock"]:
+        if state["job"] and state["job"].running:
+            return
+        job = ScanJob()
+        state["job"] = job
+    threading.Thread(target=run_scan, args=(job,), name="dashboard-scan", daemon=True).start()
     print("🔄 Scan triggered by user")
 
+def run_scan(job: ScanJob):
+    try:
+        _scan(job)
+    except Exception as e:
+        job.error = str(e)
+        print(f"❌ Scan failed: {e}")
+    finally:
+        job.finished_at = datetime.now()
+        print("✅ Scan completed")
+
+def _scan(job: ScanJob):
+    # Scraper, analyzer and pipeline load only when a scan actually runs
+    from core.notifier import Outbox
+    from core.pipeline import CheckPipeline, SOURCE_COLUMNS
+    from core.hosts import HostProfiles
+    from core.leases import get_lease_store, worker_id, LEASE_BATCH
+    from core import metrics
+
+    # The registry is process-wide and this process lives on: count this scan only
+    metrics.reset()
+    sources = list(iter_rows("monitored_pages", SOURCE_COLUMNS))
+    job.total = len(sources)
+    print(f"📄 Found {len(sources)} monitored pages")
+
+    def progress(s, outcome):
+        job.current = s['name']
+        job.done += 1
+        if outcome == "failed":
+            job.messages.append(f"No content found for {s['name']}")
+        elif outcome == "llm_unavailable":
+            job.messages.append(f"LLM unavailable for {s['name']}, try again later.")
+        elif outcome == "meaningful":
+            job.messages.append(f"New update: {s['name']}")
+
+    # Same pipeline and leases as the scheduled worker, so a scan during a
+    # cron run never checks (and alerts on) the same page twice
+    outbox = Outbox(digest=False)
+    hosts = HostProfiles.load()
+    leases = get_lease_store()
+    owner = f"dashboard:{worker_id()}"
+    try:
+        for i in range(0, len(sources), LEASE_BATCH):
+            batch = sources[i:i + LEASE_BATCH]
+            if leases:
+                granted = leases.claim(owner, [s["id"] for s in batch], due_only=False)
+                busy = [s for s in batch if s["id"] not in granted]
+                if busy:
+                    job.done += len(busy)
+                    job.messages.append(f"{len(busy)} pages are being checked by the scheduled worker, skipped.")
+                batch = [s for s in batch if s["id"] in granted]
+            if not batch:
+                continue
+            try:
+                CheckPipeline(outbox, on_progress=progress, hosts=hosts).run(batch)
+            finally:
+                if leases:
+                    leases.release(owner, [s["id"] for s in batch])
+    finally:
+        # Alerts of changes already stored are still sent if a stage crashed
+        print(f"📧 Emails: {outbox.flush()}")
+
+@st.fragment(run_every=2)
+def scan_status():
+    """Polls the background scan; reloads the feed once a scan finishes."""
+    job = scan_state()["job"]
+    if job is None:
+        return
+    if job.running:
+        label = f"Scanning {job.current}… ({job.done}/{job.total})" if job.total else "Starting scan…"
+        st.progress(job.done / job.total if job.total else 0.0, text=label)
+        return
+
+    if st.session_state.seen_scan != job.started_at:
+        # First poll after this scan finished: show fresh results
+        st.session_state.seen_scan = job.started_at
+        invalidate(load_feed)
+        st.rerun(scope="app")
+
+    if job.error:
+        st.error(f"Scan failed: {job.error}")
+    else:
+        st.success(f"Scan completed at {job.finished_at:%H:%M} ({job.done}/{job.total} pages).")
+    for msg in job.messages:
+        st.caption(msg)
+
 # --- Tabs ---
 tab_feed, tab_sources, tab_subs = st.tabs(["📢 Feed", "🔗 Sources", "📧 Subscribers"])
 
@@ -28,116 +187,100 @@ tab_feed, tab_sources, tab_subs = st.tabs(["📢 Feed", "🔗 Sources", "📧 Su
 # 📢 FEED TAB
 # ==========================================
 with tab_feed:
-    # if st.button("🔄 Scan for Updates", on_click=trigger_scan):
-    #     st.info("Scanning pages...")
-    #     print("ℹ️ Manual scan button pressed")
-
-    # Only run scan when triggered
-    if st.session_state.scan_trigger:
-        with st.spinner("Analyzing changes..."):
-            sources = supabase.table("monitored_pages").select("*").execute().data or []
-            print(f"📄 Found {len(sources)} monitored pages")
-
-            for s in sources:
-                st.write(f"Checking {s['name']}...")
-                print(f"🔍 Scraping page: {s['url']}")
-                content = scrape_page(s['url'])
-
-                if not content:
-                    st.warning(f"No content found for {s['name']}")
-                    print(f"⚠️ No content retrieved from {s['url']}")
-                    continue
-
-                new_hash = get_text_hash(content)
-                print(f"📝 New hash: {new_hash}")
-                print(f"📝 Previous hash: {s['content_hash']}")
-
-                if new_hash != s['content_hash']:
-                    print("⚡ Content changed, calling LLM for analysis")
-                    analysis = llm_analyze_change(s.get('last_content'), content)
-
-                    if not isinstance(analysis, dict):
-                        analysis = {"is_meaningful": False, "summary": ""}
-                        print("❌ LLM returned invalid format, fallback applied")
-
-                    print(f"🤖 LLM analysis: {analysis}")
-
-                    if analysis.get('is_meaningful'):
-                        db_summary = analysis['summary']
-                        if isinstance(db_summary, list):
-                            db_summary = "\n".join([f"• {item}" for item in db_summary])
-
-                        print(f"✅ Meaningful change detected, saving to Supabase and sending alerts")
-                        # Save to Supabase
-                        supabase.table("detected_changes").insert({
-                            "page_id": s['id'],
-                            "title": s['name'],
-                            "summary": db_summary,
-                            "is_meaningful": True,
-                            "url": s['url']
-                        }).execute()
-
-                        # Send alert safely
-                        send_alert(s['name'], analysis['summary'], s['url'])
-                    else:
-                        print("ℹ️ Change not meaningful, skipping alert")
-
-                    # Update hash & content
-                    supabase.table("monitored_pages").update({
-                        "last_content": content,
-                        "content_hash": new_hash,
-                        "last_checked": "now()"
-                    }).eq("id", s['id']).execute()
-                    print("💾 Updated page hash & content in Supabase")
-                else:
-                    print("ℹ️ No content change detected, skipping LLM call")
-
-            st.success("Scan completed!")
-            print("✅ Scan completed")
+    job = scan_state()["job"]
+    st.button(
+        "🔄 Scan for Updates",
+        on_click=start_scan,
+        disabled=bool(job and job.running),
+    )
+    scan_status()
+
+    # --- Filters ---
+    sources = load_sources()
+    source_names = {s['id']: s['name'] for s in sources}
+    f1, f2, f3 = st.columns([1, 2, 2])
+    unread_only = f1.toggle("Unread only")
+    source_id = f2.selectbox(
+        "Source", [None] + list(source_names),
+        format_func=lambda i: "All sources" if i is None else source_names[i],
+    )
+    dates = f3.date_input("Date range", value=[])
+    date_from = dates[0] if len(dates) > 0 else None
+    date_to = dates[1] if len(dates) > 1 else date_from
+
+    # Back to the first page whenever the filters change
+    filters = (unread_only, source_id, date_from, date_to)
+    if st.session_state.get('feed_filters') != filters:
+        st.session_state.feed_filters = filters
+        st.session_state.feed_page = 0
 
     # --- Display feed ---
-    updates = supabase.table("detected_changes").select("*").eq("is_meaningful", True).order("timestamp", desc=True).execute().data or []
+    updates, total = load_feed(st.session_state.feed_page, unread_only, source_id, date_from, date_to)
     for up in updates:
         status = "🆕" if not up['is_read'] else "✅"
         with st.expander(f"{status} {up['title']} - {up['timestamp'][:16]}"):
             st.markdown(up['summary'])
             if not up['is_read']:
                 if st.button("Mark as Read", key=f"read_{up['id']}"):
-                    supabase.table("detected_changes").update({"is_read": True}).eq("id", up['id']).execute()
-                    st.session_state.scan_trigger = not st.session_state.scan_trigger
+                    get_supabase().table("detected_changes").update({"is_read": True}).eq("id", up['id']).execute()
+                    invalidate(load_feed)
                     print(f"✔️ Marked {up['title']} as read")
+                    st.rerun()
             st.markdown(f"[View Source]({up['url']})")
 
+    # --- Pagination ---
+    pages = max(1, -(-total // FEED_PAGE_SIZE))
+    p1, p2, p3 = st.columns([1, 3, 1])
+    if p1.button("← Newer", disabled=st.session_state.feed_page == 0):
+        st.session_state.feed_page -= 1
+        st.rerun()
+    p2.caption(f"Page {st.session_state.feed_page + 1} of {pages} · {total} updates")
+    if p3.button("Older →", disabled=st.session_state.feed_page >= pages - 1):
+        st.session_state.feed_page += 1
+        st.rerun()
+
 # ==========================================
 # 🔗 SOURCES TAB
 # ==========================================
 with tab_sources:
     st.subheader("Current Sources")
-    sources = supabase.table("monitored_pages").select("id, name, url").execute().data or []
-    print(f"📌 Sources tab loaded with {len(sources)} sources")
-
-    for s in sources:
+    for s in load_sources():
         c1, c2, c3 = st.columns([2, 5, 1])
         c1.write(s['name'])
         c2.write(s['url'])
         if c3.button("🗑️", key=f"del_{s['id']}"):
             print(f"🗑️ Deleting source: {s['name']}")
-            supabase.table("detected_changes").delete().eq("page_id", s['id']).execute()
-            supabase.table("monitored_pages").delete().eq("id", s['id']).execute()
-            st.session_state.scan_trigger = not st.session_state.scan_trigger
+            get_supabase().table("detected_changes").delete().eq("page_id", s['id']).execute()
+            get_supabase().table("monitored_pages").delete().eq("id", s['id']).execute()
+            invalidate(load_sources, load_feed)
+            st.rerun()
+        with c2.expander(f"Region: {s.get('region_selector') or 'whole page'}"):
+            with st.form(f"region_form_{s['id']}"):
+                region = st.text_input("Region selector", value=s.get('region_selector') or "", help=REGION_HELP)
+                # The next check re-baselines the page under the new scope, without an alert
+                if st.form_submit_button("Save"):
+                    get_supabase().table("monitored_pages").update(
+                        {"region_selector": region.strip() or None}
+                    ).eq("id", s['id']).execute()
+                    invalidate(load_sources)
+                    print(f"✏️ Region selector for {s['name']}: {region.strip() or 'whole page'}")
+                    st.rerun()
 
     st.divider()
-    
+
     st.subheader("Add New Source")
     with st.form("add_source_form", clear_on_submit=True):
         name = st.text_input("University Name")
         url = st.text_input("URL")
+        region = st.text_input("Region selector (optional)", help=REGION_HELP)
         if st.form_submit_button("Add Source"):
             if name and url:
-                supabase.table("monitored_pages").insert({"name": name, "url": url}).execute()
+                get_supabase().table("monitored_pages").insert(
+                    {"name": name, "url": url, "region_selector": region.strip() or None}
+                ).execute()
+                invalidate(load_sources)
                 st.success(f"Added {name}!")
                 print(f"➕ Added new source: {name} ({url})")
-                st.session_state.scan_trigger = not st.session_state.scan_trigger
             else:
                 st.warning("Both fields are required.")
 
@@ -148,15 +291,14 @@ with tab_subs:
     st.subheader("Manage Subscribers")
 
     # --- List subscribers ---
-    subs_list = supabase.table("email_subscribers").select("*").execute().data or []
-    print(f"📬 Subscribers tab loaded with {len(subs_list)} subscribers")
-    for sub in subs_list:
+    for sub in load_subscribers():
         col1, col2 = st.columns([4, 1])
         col1.write(sub['email'])
         if col2.button("Remove", key=f"rem_{sub['email']}"):
-            supabase.table("email_subscribers").delete().eq("email", sub['email']).execute()
-            st.session_state.scan_trigger = not st.session_state.scan_trigger
+            get_supabase().table("email_subscribers").delete().eq("email", sub['email']).execute()
+            invalidate(load_subscribers)
             print(f"🗑️ Removed subscriber: {sub['email']}")
+            st.rerun()
 
     st.divider()
 
@@ -167,10 +309,10 @@ with tab_subs:
         if st.form_submit_button("Subscribe"):
             if "@" in email and "." in email:
                 try:
-                    supabase.table("email_subscribers").insert({"email": email}).execute()
+                    get_supabase().table("email_subscribers").insert({"email": email}).execute()
+                    invalidate(load_subscribers)
                     st.success(f"{email} added!")
                     print(f"➕ Added new subscriber: {email}")
-                    st.session_state.scan_trigger = not st.session_state.scan_trigger
                 except:
                     st.error("This email might already be subscribed.")
                     print(f"⚠️ Failed to add subscriber: {email}")
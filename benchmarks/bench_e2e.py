@@ -0,0 +1,470 @@
+"""
+Offline end-to-end benchmark of a worker run.
+
+Recorded pages from benchmarks/fixtures are served by local HTTP servers,
+one per simulated university host (127.0.0.x), with a mix of:
+
+    static   plain pages with ETags (304 on repeat fetches)
+    changing a notice whose date moves every round
+    slow     responses delayed by SLOW_S
+    ssl      served over HTTPS with a self-signed certificate
+    js       an empty shell filled in by JavaScript (needs Playwright)
+
+The real fetch ladder, extraction, fingerprinting, batched analyzer,
+snapshot store, pipeline and outbox run against a fake LLM, an in-memory
+Supabase and a fake SMTP server. Each round reports per-stage latency
+percentiles, pages per second and peak RSS.
+
+    python -m benchmarks.bench_e2e [pages] [rounds]
+"""
+import os
+import sys
+import ssl
+import time
+import base64
+import hashlib
+import resource
+import tempfile
+import threading
+import smtplib
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+os.environ.setdefault("SMTP_SERVER", "127.0.0.1")
+os.environ.setdefault("SMTP_PORT", "465")
+os.environ.setdefault("SENDER_EMAIL", "bench@example.com")
+
+from core import db, notifier, pipeline, scraper, snapshots, llm_cache
+from core.browser import close_browser_pool
+from core.llm import AsyncLLMClient, FakeBackend, set_client
+
+FIXTURES = Path(__file__).parent / "fixtures"
+HOSTS = 6
+SLOW_S = 1.5
+DB_LATENCY_S = 0.02
+SMTP_LATENCY_S = 0.05
+LLM_LATENCY_S = 0.5
+SUBSCRIBERS = 120
+
+# Page kind by index; most pages are static like the real source list
+KINDS = ("static", "changing", "static", "slow", "static", "changing", "static", "ssl", "static", "js")
+
+
+# ---------- timings ----------
+class Timings:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, stage: str, fn):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - started)
+        return timed
+
+    def reset(self):
+        with self._lock:
+            self.samples = {}
+
+
+def _pct(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+# ---------- fake Supabase ----------
+class _Response:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class _Query:
+    """The subset of the postgrest query builder the app uses."""
+
+    def __init__(self, fake, table: str):
+        self.fake = fake
+        self.table = table
+        self.op = "select"
+        self.columns = None
+        self.payload = None
+        self.on_conflict = "id"
+        self.ignore_duplicates = False
+        self.count = None
+        self.filters = []
+        self.order_by = None
+        self.window = None
+
+    def select(self, columns="*", count=None):
+        self.op, self.count = "select", count
+        if columns.strip() != "*":
+            self.columns = [c.strip() for c in columns.split(",")]
+        return self
+
+    def insert(self, rows):
+        self.op, self.payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict="id", ignore_duplicates=False):
+        self.op, self.payload = "upsert", rows
+        self.on_conflict, self.ignore_duplicates = on_conflict, ignore_duplicates
+        return self
+
+    def update(self, values):
+        self.op, self.payload = "update", values
+        return self
+
+    def delete(self):
+        self.op = "delete"
+        return self
+
+    def eq(self, col, value):
+        self.filters.append(lambda r: r.get(col) == value)
+        return self
+
+    def lt(self, col, value):
+        self.filters.append(lambda r: r.get(col) is not None and r[col] < value)
+        return self
+
+    def gte(self, col, value):
+        self.filters.append(lambda r: r.get(col) is not None and r[col] >= value)
+        return self
+
+    def in_(self, col, values):
+        values = set(values)
+        self.filters.append(lambda r: r.get(col) in values)
+        return self
+
+    def order(self, col, desc=False):
+        self.order_by = (col, desc)
+        return self
+
+    def range(self, start, end):
+        self.window = (start, end + 1)
+        return self
+
+    def limit(self, n):
+        self.window = (0, n)
+        return self
+
+    def execute(self):
+        started = time.perf_counter()
+        time.sleep(self.fake.latency_s)
+        try:
+            with self.fake.lock:
+                return self._execute(self.fake.tables.setdefault(self.table, []))
+        finally:
+            self.fake.timings.add("db", time.perf_counter() - started)
+
+    def _execute(self, rows: list[dict]):
+        if self.op in ("insert", "upsert"):
+            new = self.payload if isinstance(self.payload, list) else [self.payload]
+            cols = [c.strip() for c in self.on_conflict.split(",")] if self.op == "upsert" else []
+            for row in new:
+                key = tuple(row.get(c) for c in cols) if cols else None
+                existing = next((r for r in rows if key is not None and tuple(r.get(c) for c in cols) == key), None)
+                if existing is not None:
+                    if not self.ignore_duplicates:
+                        existing.update(row)
+                    continue
+                self.fake.next_id += 1
+                rows.append({"id": self.fake.next_id, **row})
+            return _Response(new)
+
+        matched = [r for r in rows if all(f(r) for f in self.filters)]
+        if self.op == "update":
+            for r in matched:
+                r.update(self.payload)
+            return _Response(matched)
+        if self.op == "delete":
+            rows[:] = [r for r in rows if r not in matched]
+            return _Response(matched)
+
+        if self.order_by:
+            col, desc = self.order_by
+            matched.sort(key=lambda r: (r.get(col) is None, r.get(col)), reverse=desc)
+        total = len(matched)
+        if self.window:
+            matched = matched[self.window[0]:self.window[1]]
+        if self.columns:
+            matched = [{c: r.get(c) for c in self.columns} for r in matched]
+        else:
+            matched = [dict(r) for r in matched]
+        return _Response(matched, total if self.count else None)
+
+
+class FakeSupabase:
+    def __init__(self, timings: Timings, latency_s: float = DB_LATENCY_S):
+        self.timings = timings
+        self.latency_s = latency_s
+        self.tables: dict[str, list[dict]] = {}
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def rpc(self, name: str, params: dict) -> "_Rpc":
+        return _Rpc(self, name, params)
+
+
+class _Rpc:
+    """Database functions from migrations/ the pipeline calls."""
+
+    def __init__(self, fake, name: str, params: dict):
+        self.fake, self.name, self.params = fake, name, params
+
+    def execute(self):
+        if self.name != "update_pages":
+            raise NotImplementedError(self.name)
+        started = time.perf_counter()
+        time.sleep(self.fake.latency_s)
+        try:
+            with self.fake.lock:
+                by_id = {r["id"]: r for r in self.fake.tables.setdefault("monitored_pages", [])}
+                updated = []
+                for row in self.params["p_rows"]:
+                    if row["id"] in by_id:
+                        by_id[row["id"]].update(row)
+                        updated.append(row["id"])
+                return _Response(updated)
+        finally:
+            self.fake.timings.add("db", time.perf_counter() - started)
+
+
+# ---------- fake SMTP ----------
+def _fake_smtp(timings: Timings, sent: list):
+    class FakeSMTP:
+        def __init__(self, host, port, *args, **kwargs):
+            time.sleep(SMTP_LATENCY_S)
+
+        def login(self, user, password):
+            time.sleep(SMTP_LATENCY_S)
+
+        def send_message(self, msg, to_addrs=None):
+            started = time.perf_counter()
+            time.sleep(SMTP_LATENCY_S)
+            sent.append((msg["Subject"], len(to_addrs or [])))
+            timings.add("smtp", time.perf_counter() - started)
+
+        def quit(self):
+            pass
+
+    return FakeSMTP
+
+
+# ---------- local site ----------
+class Site:
+    """Pages served to the benchmark; `round` moves the changing notices."""
+
+    def __init__(self, pages: int):
+        self.round = 0
+        fixtures = [p.read_text(encoding="utf-8") for p in sorted(FIXTURES.glob("*.html"))]
+        self.pages = {
+            f"/page/{i}": (KINDS[i % len(KINDS)], fixtures[i % len(fixtures)], i)
+            for i in range(pages)
+        }
+
+    def body(self, path: str) -> tuple[str, bytes] | None:
+        if path not in self.pages:
+            return None
+        kind, html, i = self.pages[path]
+        day = 1 + (self.round if kind == "changing" else 0) % 28
+        notice = (
+            f"<p><strong>Notice for campus {i}: the last date to apply is {day} October "
+            f"and late applications will not be accepted.</strong></p>"
+        )
+        html = html.replace("</h1>", "</h1>" + notice, 1)
+        if kind == "js":
+            encoded = base64.b64encode(html.encode("utf-8")).decode("ascii")
+            html = (
+                "<html><body><div id='app'>Loading…</div><script>"
+                "document.open();document.write(decodeURIComponent(escape(atob("
+                f"'{encoded}'))));document.close();</script></body></html>"
+            )
+        return kind, html.encode("utf-8")
+
+
+def _handler(site: Site):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            page = site.body(self.path)
+            if page is None:
+                self.send_error(404)
+                return
+            kind, body = page
+            if kind == "slow":
+                time.sleep(SLOW_S)
+            etag = '"' + hashlib.md5(body).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def _self_signed_context(workdir: str) -> ssl.SSLContext | None:
+    """TLS context with a throwaway self-signed certificate, if cryptography is available."""
+    try:
+        import datetime
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import ec
+        from cryptography.x509.oid import NameOID
+    except ImportError:
+        return None
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "bench.invalid")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder().subject_name(name).issuer_name(name)
+        .public_key(key.public_key()).serial_number(x509.random_serial_number())
+        .not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    cert_path, key_path = os.path.join(workdir, "cert.pem"), os.path.join(workdir, "key.pem")
+    Path(cert_path).write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    Path(key_path).write_bytes(key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ))
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(cert_path, key_path)
+    return ctx
+
+
+def _serve(address: str, site: Site, tls: ssl.SSLContext | None = None) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((address, 0), _handler(site))
+    if tls:
+        server.socket = tls.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _start_servers(site: Site, workdir: str) -> tuple[list, list[str], ThreadingHTTPServer | None]:
+    """One plain server per simulated host, plus an HTTPS one for the ssl pages."""
+    servers, bases = [], []
+    for h in range(HOSTS):
+        try:
+            server = _serve(f"127.0.0.{h + 2}", site)
+        except OSError:
+            # Only 127.0.0.1 is routable here: every page shares one host
+            server = _serve("127.0.0.1", site)
+        servers.append(server)
+        bases.append(f"http://{server.server_address[0]}:{server.server_address[1]}")
+
+    tls = _self_signed_context(workdir)
+    https = _serve("127.0.0.1", site, tls) if tls else None
+    if https:
+        servers.append(https)
+    return servers, bases, https
+
+
+# ---------- benchmark ----------
+def _install_fakes(timings: Timings, workdir: str, sent: list) -> FakeSupabase:
+    fake_db = FakeSupabase(timings)
+    db.set_supabase(fake_db)
+    smtplib.SMTP_SSL = _fake_smtp(timings, sent)
+
+    set_client(AsyncLLMClient(FakeBackend(latency_s=LLM_LATENCY_S), rpm=100000, tpm=10**9))
+    llm_cache.close_cache()
+    llm_cache.CACHE_PATH = os.path.join(workdir, "llm_cache.sqlite3")
+    snapshots._store = snapshots.LocalSnapshotStore(os.path.join(workdir, "snapshots.sqlite3"))
+
+    # Time the real functions where the pipeline calls them
+    pipeline.fetch_page = timings.wrap("fetch", scraper.fetch_page)
+    scraper.extract_page = timings.wrap("extract", scraper.extract_page)
+    pipeline.page_fingerprint = timings.wrap("fingerprint", pipeline.page_fingerprint)
+    pipeline.llm_analyze_batch = timings.wrap("llm", pipeline.llm_analyze_batch)
+    notifier.Outbox.flush = timings.wrap("outbox", notifier.Outbox.flush)
+    return fake_db
+
+
+def _report(label: str, timings: Timings, pages: int, elapsed: float, summary: dict, emails: dict):
+    print(f"\n{label}: {pages} pages in {elapsed:.2f}s = {pages / elapsed:.2f} pages/s")
+    print(
+        f"  checked {len(summary['checked'])}, failed {len(summary['failed'])}, "
+        f"meaningful {len(summary['meaningful'])}, llm unavailable {len(summary['llm_unavailable'])}; "
+        f"emails {emails}"
+    )
+    print(f"  {'stage':<12}{'calls':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'total s':>10}")
+    for stage, values in sorted(timings.samples.items()):
+        print(
+            f"  {stage:<12}{len(values):>7}{_pct(values, 50) * 1000:>10.1f}{_pct(values, 90) * 1000:>10.1f}"
+            f"{_pct(values, 99) * 1000:>10.1f}{max(values) * 1000:>10.1f}{sum(values):>10.2f}"
+        )
+
+
+def _peak_rss_mb(who) -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def main(pages: int = 40, rounds: int = 2):
+    workdir = tempfile.mkdtemp(prefix="bench_e2e_")
+    timings, sent = Timings(), []
+    fake_db = _install_fakes(timings, workdir, sent)
+    site = Site(pages)
+    servers, bases, https = _start_servers(site, workdir)
+
+    sources = []
+    for i, path in enumerate(site.pages):
+        kind = site.pages[path][0]
+        if kind == "ssl" and https:
+            url = f"https://127.0.0.1:{https.server_address[1]}{path}"
+        else:
+            url = f"{bases[i % len(bases)]}{path}"
+        sources.append({"name": f"Campus {i} ({kind})", "url": url})
+    fake_db.table("monitored_pages").insert(sources).execute()
+    fake_db.table("email_subscribers").insert(
+        [{"email": f"student{i}@example.com"} for i in range(SUBSCRIBERS)]
+    ).execute()
+    if not https:
+        print("cryptography not installed: ssl pages are served over plain HTTP")
+
+    try:
+        for r in range(rounds):
+            site.round = r
+            timings.reset()
+            started = time.perf_counter()
+            outbox = notifier.Outbox()
+            rows = list(db.iter_rows("monitored_pages", pipeline.SOURCE_COLUMNS))
+            summary = pipeline.CheckPipeline(outbox).run(rows)
+            emails = outbox.flush()
+            _report(f"round {r + 1}", timings, pages, time.perf_counter() - started, summary, emails)
+    finally:
+        for server in servers:
+            server.shutdown()
+        close_browser_pool()
+        llm_cache.close_cache()
+
+    print(
+        f"\npeak RSS: {_peak_rss_mb(resource.RUSAGE_SELF):.0f} MB (this process), "
+        f"{_peak_rss_mb(resource.RUSAGE_CHILDREN):.0f} MB (largest child, e.g. the browser)"
+    )
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 40,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 2,
+    )
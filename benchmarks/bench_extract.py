@@ -0,0 +1,67 @@
+"""
+Micro-benchmark: two-parse extraction (trafilatura on the raw string +
+BeautifulSoup snippets) vs the single-parse pipeline in core.extract.
+
+    python -m benchmarks.bench_extract [iterations]
+"""
+import sys
+import time
+from pathlib import Path
+from bs4 import BeautifulSoup
+from trafilatura import extract
+from core.extract import extract_content, build_content
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def legacy_extract(html: str, min_length: int = 500) -> str | None:
+    """The pre-core.extract path: the document is parsed twice."""
+    main_text = extract(html)
+    soup = BeautifulSoup(html, "lxml")
+
+    snippets = []
+    for tag in soup.find_all(["h1", "h2", "h3", "h4"]):
+        text = tag.get_text(strip=True)
+        if len(text) > 20:
+            snippets.append(f"[HEADING] {text}")
+    for table in soup.find_all("table"):
+        table_text = table.get_text(" ", strip=True)
+        if len(table_text) > 50:
+            snippets.append(f"[TABLE] {table_text[:800]}")
+    for tag in soup.find_all(["strong", "b"]):
+        text = tag.get_text(strip=True)
+        if len(text) > 20:
+            snippets.append(f"[NOTICE] {text}")
+
+    if main_text and len(main_text) > min_length:
+        return build_content(main_text, "\n".join(snippets[:10]))
+    return None
+
+
+def _time(fn, html: str, iterations: int) -> float:
+    fn(html)  # warm-up
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn(html)
+    return (time.perf_counter() - started) / iterations * 1000
+
+
+def main(iterations: int = 50):
+    print(f"{'fixture':<32}{'bytes':>8}{'legacy ms':>12}{'single ms':>12}{'speedup':>10}  same")
+    total_legacy = total_single = 0.0
+    for path in sorted(FIXTURES.glob("*.html")):
+        html = path.read_text(encoding="utf-8")
+        legacy_ms = _time(legacy_extract, html, iterations)
+        single_ms = _time(extract_content, html, iterations)
+        same = legacy_extract(html) == extract_content(html)
+        total_legacy += legacy_ms
+        total_single += single_ms
+        print(
+            f"{path.name:<32}{len(html):>8}{legacy_ms:>12.2f}{single_ms:>12.2f}"
+            f"{legacy_ms / single_ms:>9.2f}x  {'yes' if same else 'NO'}"
+        )
+    print(f"{'total':<40}{total_legacy:>12.2f}{total_single:>12.2f}{total_legacy / total_single:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
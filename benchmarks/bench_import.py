@@ -0,0 +1,70 @@
+"""
+Cold-start benchmark: time to import each entry module in a fresh
+interpreter, plus the heaviest imports behind the slowest one.
+
+    python -m benchmarks.bench_import [runs]
+"""
+import os
+import re
+import sys
+import statistics
+import subprocess
+
+MODULES = (
+    "core.db",
+    "core.notifier",
+    "core.analyzer",
+    "core.scraper",
+    "core.pipeline",
+    "worker",
+)
+TOP_IMPORTS = 8
+
+_SNIPPET = "import time; t = time.perf_counter(); import {m}; print(time.perf_counter() - t)"
+
+
+def _env() -> dict:
+    # Nothing may talk to the network at import time, so dummy credentials are fine
+    return {**os.environ, "SUPABASE_URL": "http://127.0.0.1:9", "SUPABASE_KEY": "x"}
+
+
+def _time_import(module: str) -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", _SNIPPET.format(m=module)],
+        capture_output=True, text=True, check=True, env=_env(),
+    )
+    return float(out.stdout.strip().splitlines()[-1]) * 1000
+
+
+def _heaviest(module: str) -> list[tuple[int, str]]:
+    """Other top-level packages by cumulative import time (-X importtime)."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True, env=_env(),
+    )
+    own = {module.split(".")[0], "site", "encodings"}
+    totals = {}
+    for line in out.stderr.splitlines():
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)", line)
+        if m and m.group(2).split(".")[0] not in own:
+            name = m.group(2).split(".")[0]
+            totals[name] = max(totals.get(name, 0), int(m.group(1)))
+    return sorted(((us, name) for name, us in totals.items()), reverse=True)[:TOP_IMPORTS]
+
+
+def main(runs: int = 5):
+    print(f"{'module':<16}{'median ms':>12}{'min ms':>10}")
+    results = {}
+    for module in MODULES:
+        samples = [_time_import(module) for _ in range(runs)]
+        results[module] = statistics.median(samples)
+        print(f"{module:<16}{results[module]:>12.1f}{min(samples):>10.1f}")
+
+    slowest = max(results, key=results.get)
+    print(f"\nheaviest imports behind {slowest}:")
+    for us, name in _heaviest(slowest):
+        print(f"  {name:<24}{us / 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,48 @@
+"""
+Offline benchmark of the analyzer path with the deterministic fake model:
+sequential per-page calls vs batched, parallel analysis.
+
+    python -m benchmarks.bench_llm [pages] [latency_s]
+"""
+import os
+import sys
+import time
+import tempfile
+from core import analyzer, llm_cache
+from core.llm import AsyncLLMClient, FakeBackend, set_client
+
+
+def _pairs(n: int) -> list[tuple[str, str]]:
+    pairs = []
+    for i in range(n):
+        old = f"PRIMARY_CONTENT:\nWelcome to campus {i}\nApply online\nLast date to apply is 1 Oct"
+        new = f"PRIMARY_CONTENT:\nWelcome to campus {i}\nApply online\nLast date to apply is {2 + i % 27} Oct"
+        pairs.append((old, new))
+    return pairs
+
+
+def _run(label: str, fn, pages: int, latency_s: float):
+    backend = FakeBackend(latency_s=latency_s)
+    set_client(AsyncLLMClient(backend, rpm=100000, tpm=10**9))
+    # Fresh, empty cache per mode, away from the real one
+    llm_cache.close_cache()
+    llm_cache.CACHE_PATH = os.path.join(tempfile.mkdtemp(), "bench_cache.sqlite3")
+
+    started = time.perf_counter()
+    results = fn(_pairs(pages))
+    elapsed = time.perf_counter() - started
+    meaningful = sum(1 for r in results if r and r["is_meaningful"])
+    print(f"{label:<12}{elapsed:>10.2f}s{backend.calls:>8} calls{meaningful:>8} meaningful")
+
+
+def main(pages: int = 40, latency_s: float = 0.5):
+    print(f"{pages} changed pages, fake model latency {latency_s}s")
+    _run("sequential", lambda pairs: [analyzer.llm_analyze_change(o, n) for o, n in pairs], pages, latency_s)
+    _run("batched", analyzer.llm_analyze_batch, pages, latency_s)
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 40,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 0.5,
+    )
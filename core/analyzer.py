@@ -1,17 +1,19 @@
 import os
 import json
 import re
-import google.generativeai as genai
+import asyncio
+from core.diff import render_diff
+from core.utils import get_text_hash
+from core.llm_cache import AnalysisCache, get_cache
+from core.llm import AsyncLLMClient, LLMUnavailableError, LLMBlockedError, get_client
 
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+MODEL_NAME = "gemini-2.5-flash"
+# Bump whenever the prompt or its post-processing changes, to invalidate cached analyses
+PROMPT_VERSION = "3"
 
-model = genai.GenerativeModel(
-    "gemini-2.5-flash",
-    generation_config={
-        "temperature": 0.1,
-        "top_p": 0.9
-    }
-)
+def _client() -> AsyncLLMClient:
+    # Built on first use; LLM_BACKEND=fake swaps in the offline model
+    return get_client(MODEL_NAME)
 
 # -------------------------------
 # Schema definition
@@ -53,6 +55,24 @@ def _extract_json(text: str) -> dict | None:
         return None
 
 
+def _extract_json_array(text: str) -> list | None:
+    """Extract the first JSON array from LLM output (batch mode)."""
+    try:
+        text = re.sub(r"^```json|^```", "", text.strip(), flags=re.MULTILINE)
+        text = re.sub(r"```$", "", text.strip(), flags=re.MULTILINE)
+
+        start = text.find("[")
+        end = text.rfind("]")
+        if start == -1 or end == -1 or end <= start:
+            return None
+
+        data = json.loads(text[start:end+1])
+        return data if isinstance(data, list) else None
+    except Exception as e:
+        print("⚠️ JSON array extraction error:", e)
+        return None
+
+
 def _validate_schema(data: dict) -> dict | None:
     """Validate structure and types strictly"""
     try:
@@ -77,19 +97,38 @@ def _validate_schema(data: dict) -> dict | None:
     except Exception:
         return None
 
-def llm_analyze_change(old_text: str | None, new_text: str) -> dict:
-    prompt = f"""
-You are a Data Analyst for a student notification system. You analyze changes made to university websites to see if they matter to students.
+# Prompt budget for the changed hunks / first-seen page content
+MAX_DIFF_CHARS = 4000
+MAX_NEW_CHARS = 1200
 
-Analyze OLD vs NEW content and respond ONLY with JSON.
+# Batch mode: rough token budget per request (~4 chars/token) and page cap
+BATCH_TOKEN_BUDGET = int(os.getenv("LLM_BATCH_TOKEN_BUDGET", "12000"))
+BATCH_MAX_PAGES = int(os.getenv("LLM_BATCH_MAX_PAGES", "12"))
 
-OLD:
-{(old_text or "None")[:1200]}
+def _changes_section(old_text: str | None, new_text: str) -> str | None:
+    """
+    What the model sees: only the changed blocks (with a little context)
+    when there is an old version, otherwise the start of the new page.
+    Returns None when nothing changed at block level.
+    """
+    if not old_text:
+        return f"""OLD:
+None
 
 NEW:
-{new_text[:1200]}
+{new_text[:MAX_NEW_CHARS]}"""
+
+    diff = render_diff(old_text, new_text, context=1, max_chars=MAX_DIFF_CHARS)
+    if not diff:
+        return None
+    return f"""CHANGES (lines starting with "-" were removed, "+" were added, others are unchanged context):
+{diff}"""
 
-Mark is_meaningful = true ONLY IF:
+def _cache_key(changes: str) -> str:
+    # Whitespace only: any other normalization could merge two different changes
+    return AnalysisCache.make_key(_client().model_name, PROMPT_VERSION, get_text_hash(" ".join(changes.split())))
+
+_RULES = """Mark is_meaningful = true ONLY IF:
 - deadlines changed
 - eligibility changed
 - fee structure changed
@@ -98,19 +137,30 @@ Mark is_meaningful = true ONLY IF:
 Consider the following operational rules for more details:
 
 **Operational Rules**:
-1. **Analyze the Diff**: You are given above the text that was OLD and text that is NEW.
+1. **Analyze the Diff**: You are given above only the parts of the page that changed, or the NEW page when there is no OLD version.
 2. **Relevance Criteria (Report these)**:
     * Admissions (deadlines, open/close status).
     * Fees (price changes, new challan forms).
     * Eligibility (rule changes).
     * Schedule (datesheets, holidays).
     * Policies (grading, hostel, housing rules).
+    * Documents: "[DOC]" lines list files linked from the page (PDFs, images). A new or replaced merit list, fee challan, datesheet or notice is meaningful; name it in the summary. A hash or size change means the file itself was re-uploaded.
 3. **Ignore Criteria (Silence these)**:
     * Generic design/layout changes in the pages or navigation.
     * Fixing typos (e.g., "teh" -> "the").
     * Changing years in footers (e.g., "Copyright 2024" -> "2025").
     * Rephrasing that implies no factual change relevant to the students.
-    * Generic "Announcements" headers moving around.
+    * Generic "Announcements" headers moving around."""
+
+def _build_prompt(changes: str) -> str:
+    return f"""
+You are a Data Analyst for a student notification system. You analyze changes made to university websites to see if they matter to students.
+
+Analyze the changes between the OLD and NEW content and respond ONLY with JSON.
+
+{changes}
+
+{_RULES}
 
     
 return JSON format ONLY:
@@ -121,27 +171,50 @@ return JSON format ONLY:
 }}
 """
 
-    try:
-        response = model.generate_content(prompt)
-        raw = response.text or ""
-        print("LLM raw response:", raw)
-    except Exception as e:
-        print("Gemini call failed:", e)
-        return _safe_default()
+def _build_batch_prompt(pages: list[tuple[int, str]]) -> str:
+    sections = "\n\n".join(f"=== PAGE {pid} ===\n{changes}" for pid, changes in pages)
+    return f"""
+You are a Data Analyst for a student notification system. You analyze changes made to university websites to see if they matter to students.
+
+Below are changes for {len(pages)} separate pages, each starting with "=== PAGE <id> ===". Analyze every page independently and respond ONLY with JSON.
+
+{sections}
+
+{_RULES}
+
+    
+return a JSON array ONLY, with exactly one object per page:
+[
+  {{
+    "id": <page id>,
+    "is_meaningful": true or false,
+    "summary": ["bullet point 1", "bullet point 2"],
+    "confidence": 0.0 to 1.0
+  }}
+]
+"""
 
+def _interpret(raw: str) -> dict | None:
+    """
+    Turn raw model output into a final analysis.
+    Returns None when the output is unusable (not worth caching).
+    """
     # 1️⃣ Extract JSON
     parsed = _extract_json(raw)
     if not parsed:
         print("❌ JSON extraction failed")
-        return _safe_default()
+        return None
 
     print("✅ JSON extracted:", parsed
           )
+    return _finalize(parsed)
+
+def _finalize(parsed: dict) -> dict | None:
     # 2️⃣ Validate schema
     validated = _validate_schema(parsed)
     if not validated:
         print("❌ Schema validation failed:", parsed)
-        return _safe_default()
+        return None
 
     # 3️⃣ Semantic guard
     if validated["is_meaningful"] and validated["confidence"] < 0.6:
@@ -150,4 +223,139 @@ return JSON format ONLY:
 
     return validated
 
+async def analyze_change_async(old_text: str | None, new_text: str) -> dict:
+    """
+    Analyze one change. Must run on the LLM client's loop.
+    Raises LLMUnavailableError when the model cannot be reached, so callers
+    can retry later instead of treating the change as "not meaningful".
+    """
+    changes = _changes_section(old_text, new_text)
+    if changes is None:
+        print("ℹ️ No block-level differences — skipping LLM call")
+        return _safe_default()
+
+    cache = get_cache()
+    key = _cache_key(changes)
+    if cache:
+        cached = cache.get(key)
+        if cached is not None:
+            print("💾 LLM cache hit")
+            return cached
+
+    try:
+        raw = await _client().generate(_build_prompt(changes))
+    except LLMBlockedError as e:
+        # Permanent: cache the default so the same diff is not sent again
+        print("⚠️ LLM refused the change, treating it as not meaningful:", e)
+        if cache:
+            cache.put(key, _safe_default())
+        return _safe_default()
+    print("LLM raw response:", raw)
+
+    result = _interpret(raw)
+    if result is None:
+        return _safe_default()
+
+    if cache:
+        cache.put(key, result)
+    return result
+
+def llm_analyze_change(old_text: str | None, new_text: str) -> dict:
+    """Blocking wrapper around analyze_change_async. Raises LLMUnavailableError."""
+    return _client().run(analyze_change_async(old_text, new_text))
+
+def _pack_batches(pending: list[tuple[int, str]]) -> list[list[tuple[int, str]]]:
+    """Greedily pack (index, changes) pairs into batches under the token budget."""
+    batches, current, used = [], [], 0
+    for item in pending:
+        tokens = len(item[1]) // 4 + 20
+        if current and (used + tokens > BATCH_TOKEN_BUDGET or len(current) >= BATCH_MAX_PAGES):
+            batches.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+async def _analyze_batch(batch: list[tuple[int, str]], keys: dict, results: list):
+    """One multi-page request; fills `results` for every page it settles."""
+    prompt = _build_batch_prompt([(i + 1, changes) for i, changes in batch])
+    try:
+        raw = await _client().generate(prompt)
+        print("LLM raw batch response:", raw)
+    except (LLMUnavailableError, LLMBlockedError) as e:
+        # A block may come from one page; the per-page fallback isolates it
+        print(f"Gemini batch call failed ({len(batch)} pages):", e)
+        return
+
+    cache = get_cache()
+    items = _extract_json_array(raw) or []
+    by_id = {
+        item.get("id"): item for item in items
+        if isinstance(item, dict) and isinstance(item.get("id"), int)
+    }
+    for i, _ in batch:
+        item = by_id.get(i + 1)
+        if item is None:
+            continue
+        item = {k: v for k, v in item.items() if k != "id"}
+        result = _finalize(item)
+        if result is None:
+            continue
+        results[i] = result
+        if cache:
+            cache.put(keys[i], result)
+
+async def _analyze_single_or_none(old_text: str | None, new_text: str) -> dict | None:
+    try:
+        return await analyze_change_async(old_text, new_text)
+    except LLMUnavailableError as e:
+        print("Gemini call failed:", e)
+        return None
+
+async def analyze_batch_async(pairs: list[tuple[str | None, str]]) -> list[dict | None]:
+    """
+    Analyze several (old_text, new_text) pairs with as few model calls as
+    possible; batches and fallbacks run in parallel within the client's
+    limits. Returns one analysis per pair, in order, or None for pages the
+    model could not be reached for. Pages the batch answer leaves out or
+    gets wrong are re-analyzed one by one.
+    """
+    results: list[dict | None] = [None] * len(pairs)
+    cache = get_cache()
+    pending = []
+    keys = {}
+
+    for i, (old_text, new_text) in enumerate(pairs):
+        changes = _changes_section(old_text, new_text)
+        if changes is None:
+            results[i] = _safe_default()
+            continue
+        keys[i] = _cache_key(changes)
+        cached = cache.get(keys[i]) if cache else None
+        if cached is not None:
+            print(f"💾 LLM cache hit (page {i + 1})")
+            results[i] = cached
+            continue
+        pending.append((i, changes))
+
+    # Single-page batches are left to the per-page path below
+    await asyncio.gather(*(
+        _analyze_batch(batch, keys, results)
+        for batch in _pack_batches(pending) if len(batch) > 1
+    ))
+
+    # Per-page fallback for anything the batch did not settle
+    missing = [i for i, _ in pending if results[i] is None]
+    for i in missing:
+        print(f"↩️ Falling back to single analysis for page {i + 1}")
+    singles = await asyncio.gather(*(_analyze_single_or_none(*pairs[i]) for i in missing))
+    for i, result in zip(missing, singles):
+        results[i] = result
+
+    return results
 
+def llm_analyze_batch(pairs: list[tuple[str | None, str]]) -> list[dict | None]:
+    """Blocking wrapper around analyze_batch_async."""
+    return _client().run(analyze_batch_async(pairs))
@@ -0,0 +1,141 @@
+import os
+import atexit
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Max pages rendered at once by the shared browser
+MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", "3"))
+
+
+class BrowserPool:
+    """
+    One long-lived headless Chromium shared by every thread of a run.
+
+    Playwright's sync API is bound to the thread that created it, so the
+    browser lives on a private asyncio loop thread and callers submit work
+    to it. Each render gets its own isolated context, closed even when
+    navigation fails, and at most `max_pages` renders run at once.
+    """
+
+    def __init__(self, max_pages: int = MAX_PAGES):
+        self.max_pages = max(1, max_pages)
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._playwright = None
+        self._browser = None
+        self._sem = None
+        self._launch_lock = None
+
+    # ---------- lifecycle ----------
+    def _ensure_started(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(
+                target=self._loop.run_forever, name="browser-pool", daemon=True
+            )
+            self._thread.start()
+            try:
+                asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+            except Exception:
+                try:
+                    asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result(timeout=30)
+                finally:
+                    self._shutdown_loop()
+                raise
+
+    async def _start(self):
+        self._sem = asyncio.Semaphore(self.max_pages)
+        self._launch_lock = asyncio.Lock()
+        # Imported here so importing the scraper doesn't load Playwright
+        from playwright.async_api import async_playwright
+        self._playwright = await async_playwright().start()
+        await self._launch()
+
+    async def _launch(self):
+        self._browser = await self._playwright.chromium.launch(headless=True)
+        logger.info("[browser] Chromium launched")
+
+    async def _ensure_browser(self):
+        # Relaunch if Chromium crashed during an earlier render
+        async with self._launch_lock:
+            if self._browser is None or not self._browser.is_connected():
+                await self._launch()
+
+    async def _stop(self):
+        try:
+            if self._browser:
+                await self._browser.close()
+        finally:
+            if self._playwright:
+                await self._playwright.stop()
+            self._browser = None
+            self._playwright = None
+
+    def close(self):
+        """Shut down the browser and its loop thread. Safe to call twice."""
+        with self._lock:
+            if self._loop is None:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result(timeout=30)
+            except Exception as e:
+                logger.error(f"[browser] Error while closing: {e}")
+            self._shutdown_loop()
+
+    def _shutdown_loop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+        self._loop = None
+        self._thread = None
+
+    # ---------- rendering ----------
+    async def _render(self, url: str, timeout_ms: int, wait_until: str) -> str:
+        async with self._sem:
+            await self._ensure_browser()
+            context = await self._browser.new_context()
+            try:
+                page = await context.new_page()
+                await page.goto(url, wait_until=wait_until, timeout=timeout_ms)
+                return await page.content()
+            finally:
+                await context.close()
+
+    def render(self, url: str, timeout_ms: int = 60000, wait_until: str = "networkidle") -> str:
+        """Render `url` and return the final HTML. Blocks the calling thread."""
+        self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(
+            self._render(url, timeout_ms, wait_until), self._loop
+        )
+        return future.result()
+
+
+_pool: BrowserPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool() -> BrowserPool:
+    """Return the process-wide browser pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+        return _pool
+
+
+def close_browser_pool():
+    """Close the process-wide browser pool if it was ever started."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+atexit.register(close_browser_pool)
@@ -0,0 +1,52 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urlparse
+
+
+def host_of(url: str) -> str:
+    """Return the lowercase host of a URL (without a leading www.)."""
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def run_bounded(items, fn, key, max_workers: int = 8, per_key: int = 2):
+    """
+    Run `fn(item)` over `items` on a thread pool and yield
+    `(item, result, error)` tuples as they complete.
+
+    At most `max_workers` calls run at once overall and at most `per_key`
+    calls run at once for any `key(item)` (e.g. the host of a URL).
+    Items whose key is saturated wait in the queue without holding a
+    worker thread, so one slow host never blocks the rest of the run.
+    """
+    pending = deque(items)
+    in_flight: dict[str, int] = {}
+    futures = {}
+    max_workers = max(1, max_workers)
+    per_key = max(1, per_key)
+
+    def _submit_ready(pool):
+        skipped = deque()
+        while pending and len(futures) < max_workers:
+            item = pending.popleft()
+            k = key(item)
+            if in_flight.get(k, 0) >= per_key:
+                skipped.append(item)
+                continue
+            in_flight[k] = in_flight.get(k, 0) + 1
+            futures[pool.submit(fn, item)] = (item, k)
+        # Keep original order for items we could not schedule yet
+        pending.extendleft(reversed(skipped))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        _submit_ready(pool)
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for fut in done:
+                item, k = futures.pop(fut)
+                in_flight[k] -= 1
+                try:
+                    yield item, fut.result(), None
+                except Exception as e:
+                    yield item, None, e
+            _submit_ready(pool)
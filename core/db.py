@@ -1,10 +1,133 @@
 import os
-from supabase import create_client
+import threading
 from dotenv import load_dotenv
+from core import metrics
 
 load_dotenv()
 
-supabase = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_KEY")
-)
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_supabase():
+    """Process-wide Supabase client, created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            from supabase import create_client
+            _client = create_client(
+                os.getenv("SUPABASE_URL"),
+                os.getenv("SUPABASE_KEY")
+            )
+        return _client
+
+
+def set_supabase(client):
+    """Swap the process-wide client (e.g. for an in-memory fake in benchmarks)."""
+    global _client
+    with _client_lock:
+        _client = client
+
+
+def __getattr__(name: str):
+    # `from core.db import supabase` keeps working, but builds the client lazily
+    if name == "supabase":
+        return get_supabase()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Rows per request for paged reads and bulk writes
+PAGE_SIZE = 500
+WRITE_CHUNK = 100
+
+
+def iter_rows(table: str, columns: str, page_size: int = PAGE_SIZE, order: str = "id"):
+    """Yield rows of `table` page by page, selecting only `columns`."""
+    start = 0
+    while True:
+        with metrics.timer("db_seconds", op="select", table=table):
+            rows = (
+                get_supabase().table(table)
+                .select(columns)
+                .order(order)
+                .range(start, start + page_size - 1)
+                .execute()
+                .data
+                or []
+            )
+        yield from rows
+        if len(rows) < page_size:
+            return
+        start += page_size
+
+
+def fetch_by_ids(table: str, columns: str, ids: list, chunk: int = WRITE_CHUNK) -> dict:
+    """Load `columns` for the given ids in a few `in` queries; returns {id: row}."""
+    out = {}
+    ids = list(ids)
+    for i in range(0, len(ids), chunk):
+        with metrics.timer("db_seconds", op="select_ids", table=table):
+            rows = (
+                get_supabase().table(table)
+                .select(columns)
+                .in_("id", ids[i:i + chunk])
+                .execute()
+                .data
+                or []
+            )
+        out.update({r["id"]: r for r in rows})
+    return out
+
+
+class BatchWriter:
+    """
+    Buffers rows and writes them in chunks: bulk upsert when `on_conflict`
+    is given, bulk insert otherwise. Rows in one writer should share the
+    same keys, since missing keys are written as null.
+
+    With `rpc`, chunks go to that database function as {"p_rows": rows}
+    instead (e.g. "update_pages", which only updates existing rows and
+    only the keys each row has).
+
+    `add()` only buffers; the caller decides when to `flush()`, so a write
+    error surfaces where it can be handled. A chunk that fails to write
+    stays buffered and the error is raised, so nothing is dropped silently.
+    `returned` holds what the last flush wrote: the ids an rpc returned, or
+    the rows themselves.
+    """
+
+    def __init__(self, table: str, on_conflict: str | None = None, chunk: int = WRITE_CHUNK,
+                 rpc: str | None = None):
+        self.table = table
+        self.on_conflict = on_conflict
+        self.rpc = rpc
+        self.chunk = chunk
+        self._rows: list[dict] = []
+        self.returned: list = []
+        self.written = 0
+
+    def add(self, row: dict):
+        self._rows.append(row)
+
+    @property
+    def buffered(self) -> list[dict]:
+        """Rows not written yet."""
+        return list(self._rows)
+
+    def flush(self):
+        self.returned = []
+        while self._rows:
+            rows = self._rows[:self.chunk]
+            op = self.rpc or ("upsert" if self.on_conflict else "insert")
+            with metrics.timer("db_seconds", op=op, table=self.table):
+                if self.rpc:
+                    returned = get_supabase().rpc(self.rpc, {"p_rows": rows}).execute().data or []
+                elif self.on_conflict:
+                    get_supabase().table(self.table).upsert(rows, on_conflict=self.on_conflict).execute()
+                    returned = rows
+                else:
+                    get_supabase().table(self.table).insert(rows).execute()
+                    returned = rows
+            del self._rows[:len(rows)]
+            metrics.inc("db_rows_written_total", len(returned), table=self.table)
+            self.written += len(returned)
+            self.returned += returned
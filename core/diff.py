@@ -0,0 +1,120 @@
+import os
+import re
+from difflib import SequenceMatcher
+
+# Longest single block shown in a rendered diff
+MAX_BLOCK_CHARS = 500
+
+
+def split_blocks(text: str | None) -> list[str]:
+    """
+    Split page content into diffable blocks.
+    Paragraphs, table rows and snippet lines each sit on their own line.
+    """
+    if not text:
+        return []
+    blocks = []
+    for line in text.splitlines():
+        line = re.sub(r"\s+", " ", line).strip()
+        if line:
+            blocks.append(line)
+    return blocks
+
+
+def diff_blocks(old_text: str | None, new_text: str | None, context: int = 1) -> list[dict]:
+    """
+    Block-level diff between two versions of a page.
+
+    Returns hunks of the form
+    {"old_start": int, "new_start": int, "lines": [(tag, block), ...]}
+    where tag is " " (context), "-" (removed) or "+" (added).
+    """
+    old_blocks = split_blocks(old_text)
+    new_blocks = split_blocks(new_text)
+    # Compare case-insensitively, like get_text_hash
+    matcher = SequenceMatcher(
+        None,
+        [b.lower() for b in old_blocks],
+        [b.lower() for b in new_blocks],
+        autojunk=False,
+    )
+
+    hunks = []
+    for group in matcher.get_grouped_opcodes(context):
+        lines = []
+        for op, i1, i2, j1, j2 in group:
+            if op == "equal":
+                lines.extend((" ", b) for b in new_blocks[j1:j2])
+                continue
+            if op in ("replace", "delete"):
+                lines.extend(("-", b) for b in old_blocks[i1:i2])
+            if op in ("replace", "insert"):
+                lines.extend(("+", b) for b in new_blocks[j1:j2])
+        hunks.append({
+            "old_start": group[0][1],
+            "new_start": group[0][3],
+            "lines": lines,
+        })
+    return hunks
+
+
+def _pair_replacements(lines: list[tuple[str, str]]) -> list[str | None]:
+    """For each "-"/"+" line of a replace, the block it replaced or was replaced by."""
+    partners = [None] * len(lines)
+    i = 0
+    while i < len(lines):
+        if lines[i][0] != "-":
+            i += 1
+            continue
+        j = i
+        while j < len(lines) and lines[j][0] == "-":
+            j += 1
+        k = j
+        while k < len(lines) and lines[k][0] == "+":
+            k += 1
+        for a, b in zip(range(i, j), range(j, k)):
+            partners[a], partners[b] = lines[b][1], lines[a][1]
+        i = k
+    return partners
+
+
+def clip_block(block: str, other: str | None = None, limit: int = MAX_BLOCK_CHARS) -> str:
+    """
+    Shorten a long block to `limit` chars. With the block it replaced (or
+    was replaced by), the window starts just before the first difference,
+    so a change deep inside a long table row stays visible.
+    """
+    if len(block) <= limit:
+        return block
+    start = 0
+    if other:
+        same = len(os.path.commonprefix([block.lower(), other.lower()]))
+        start = max(0, min(same - limit // 4, len(block) - limit))
+    end = start + limit
+    return ("… " if start else "") + block[start:end] + (" …" if end < len(block) else "")
+
+
+def render_diff(old_text: str | None, new_text: str | None,
+                context: int = 1, max_chars: int = 4000) -> str:
+    """
+    Render only the changed hunks (plus `context` blocks around them) as
+    compact text for the LLM prompt. Returns "" when nothing changed.
+    """
+    hunks = diff_blocks(old_text, new_text, context=context)
+    out = []
+    used = 0
+    for idx, hunk in enumerate(hunks):
+        rendered = [f"@@ block {hunk['new_start'] + 1} @@"]
+        partners = _pair_replacements(hunk["lines"])
+        for (tag, block), other in zip(hunk["lines"], partners):
+            rendered.append(f"{tag} {clip_block(block, other)}")
+        text = "\n".join(rendered)
+        if not out and len(text) > max_chars:
+            text = text[:max_chars] + " …"
+
+        if out and used + len(text) > max_chars:
+            out.append(f"... ({len(hunks) - idx} more changed sections omitted)")
+            break
+        out.append(text)
+        used += len(text)
+    return "\n".join(out)
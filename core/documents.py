@@ -0,0 +1,336 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from urllib.parse import urljoin, urldefrag, urlparse
+from core import metrics, scheduler
+from core.concurrency import run_bounded, host_of
+from core.retry import classify_status, classify_exception, PERMANENT
+
+logger = logging.getLogger(__name__)
+
+DOCUMENTS_ENABLED = os.getenv("TRACK_DOCUMENTS", "1") == "1"
+# Linked files worth tracking, by URL path extension
+DOC_EXTENSIONS = (
+    ".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx",
+    ".jpg", ".jpeg", ".png", ".webp", ".gif",
+)
+DOC_MAX_PER_PAGE = int(os.getenv("DOC_MAX_PER_PAGE", "30"))
+# Only this many bytes of a file are downloaded and hashed
+DOC_MAX_BYTES = int(os.getenv("DOC_MAX_BYTES", str(25 * 1024 * 1024)))
+DOC_CHUNK_BYTES = 64 * 1024
+# Per request (connect / between reads); the page's whole check has DOC_CHECK_BUDGET_S
+DOC_TIMEOUT_S = int(os.getenv("DOC_TIMEOUT_S", "5"))
+DOC_CHECK_BUDGET_S = int(os.getenv("DOC_CHECK_BUDGET_S", "60"))
+# Parallel probes per page, and per host within it
+DOC_WORKERS = int(os.getenv("DOC_WORKERS", "4"))
+DOC_PER_HOST = int(os.getenv("DOC_PER_HOST", "2"))
+
+SECTION_HEADER = "LINKED_DOCUMENTS:"
+
+_local = threading.local()
+
+
+def is_document(url: str) -> bool:
+    return urlparse(url).path.lower().endswith(DOC_EXTENSIONS)
+
+
+def document_links(tree, base_url: str | None = None) -> list[dict]:
+    """[{url, title}] for document links in a parsed page, in page order, deduplicated."""
+    links, seen = [], set()
+    for el in tree.xpath("//a[@href] | //iframe[@src] | //embed[@src]"):
+        href = (el.get("href") or el.get("src") or "").strip()
+        if not href or href.startswith(("mailto:", "javascript:", "#")):
+            continue
+        url = urldefrag(urljoin(base_url or "", href))[0]
+        if not is_document(url) or url in seen:
+            continue
+        seen.add(url)
+        title = " ".join(el.text_content().split())[:200] if el.tag == "a" else ""
+        links.append({"url": url, "title": title or url.rsplit("/", 1)[-1]})
+        if len(links) >= DOC_MAX_PER_PAGE:
+            break
+    return links
+
+
+def render_section(docs: list[dict]) -> str:
+    """
+    The LINKED_DOCUMENTS block appended to page content, sorted by URL for
+    clean diffs. Rendered even when empty, so content from before tracking
+    (no header at all) can be told apart.
+    """
+    lines = [SECTION_HEADER]
+    # Links that never answered are remembered for back-off, not listed
+    for d in sorted((d for d in docs if d.get("content_hash")), key=lambda d: d["url"]):
+        size = d.get("content_length")
+        lines.append(
+            f"[DOC] {d['title']} ({d['url']})"
+            f" [size {size if size is not None else '?'}, hash {(d.get('content_hash') or '?')[:12]}]"
+        )
+    return "\n".join(lines)
+
+
+def with_section(content: str, section: str | None) -> str:
+    """Replace (or drop, when `section` is None) the LINKED_DOCUMENTS block of `content`."""
+    base = content.split(f"\n\n{SECTION_HEADER}", 1)[0]
+    return f"{base}\n\n{section}" if section else base
+
+
+def section_of(content: str) -> str | None:
+    """The LINKED_DOCUMENTS block of `content`, or None if it has none."""
+    i = content.find(f"\n\n{SECTION_HEADER}")
+    return content[i + 2:] if i >= 0 else None
+
+
+def delete_documents(page_id, urls: list[str]):
+    """Forget links that disappeared from a page."""
+    from core.db import get_supabase
+    try:
+        with metrics.timer("db_seconds", op="delete", table="page_documents"):
+            get_supabase().table("page_documents").delete().eq("page_id", page_id).in_("url", urls).execute()
+    except Exception as e:
+        logger.error(f"[documents] Could not delete removed documents of page {page_id}: {e}")
+
+
+def _session():
+    session = getattr(_local, "session", None)
+    if session is None:
+        import requests
+        session = requests.Session()
+        session.headers["User-Agent"] = (
+            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+            "AppleWebKit/537.36 (KHTML, like Gecko) "
+            "Chrome/120.0.0.0 Safari/537.36"
+        )
+        _local.session = session
+    return session
+
+
+SIGNALS = ("etag", "last_modified", "content_length")
+# Back-off state per document, same columns and rules as pages (core.scheduler)
+SCHEDULE = ("change_rate", "check_interval_s", "next_due_at", "failures")
+
+
+def _signals(headers) -> dict:
+    length = headers.get("Content-Length")
+    return {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "content_length": int(length) if length and length.isdigit() else None,
+    }
+
+
+def _same_file(old: dict, signals: dict) -> bool:
+    """
+    Whether HEAD signals say the stored file is unchanged: no signal may
+    contradict, and the ETag or size must match, or else Last-Modified
+    when the server sends neither.
+    """
+    if any(signals[k] is not None and old.get(k) is not None and signals[k] != old[k] for k in SIGNALS):
+        return False
+    strong = ("etag", "content_length")
+    if any(signals[k] is not None for k in strong):
+        return any(signals[k] is not None and signals[k] == old.get(k) for k in strong)
+    return signals["last_modified"] is not None and signals["last_modified"] == old.get("last_modified")
+
+
+def _has_signals(signals: dict) -> bool:
+    return any(signals[k] is not None for k in SIGNALS)
+
+
+def probe(url: str, verify: bool = True) -> tuple[dict | None, str | None]:
+    """
+    Cheap change signals (ETag, Last-Modified, Content-Length) via HEAD.
+    Returns (signals, None), or (None, failure class from core.retry).
+    """
+    session = _session()
+    try:
+        with metrics.timer("document_seconds", op="head"):
+            res = session.head(url, timeout=DOC_TIMEOUT_S, allow_redirects=True, verify=verify)
+            if res.status_code in (405, 501):
+                # No HEAD support: read the headers of a GET and drop the body
+                res = session.get(url, timeout=DOC_TIMEOUT_S, stream=True, verify=verify)
+                res.close()
+    except Exception as e:
+        return None, classify_exception(e)
+    if res.status_code != 200:
+        return None, classify_status(res.status_code)
+    return _signals(res.headers), None
+
+
+def content_hash(url: str, verify: bool = True, deadline: float | None = None) -> tuple[str | None, int]:
+    """
+    Stream the file and hash it chunk by chunk, reading at most DOC_MAX_BYTES.
+    Returns (hash, bytes read); the hash is None if the download failed or
+    ran past `deadline` (time.monotonic()).
+    """
+    h = hashlib.blake2b(digest_size=16)
+    read = 0
+    try:
+        with metrics.timer("document_seconds", op="download"):
+            with _session().get(url, timeout=DOC_TIMEOUT_S, stream=True, verify=verify) as res:
+                res.raise_for_status()
+                for chunk in res.iter_content(DOC_CHUNK_BYTES):
+                    if deadline and time.monotonic() > deadline:
+                        logger.warning(f"[documents] Out of time downloading {url}, trying again next run")
+                        return None, read
+                    take = chunk[:DOC_MAX_BYTES - read]
+                    h.update(take)
+                    read += len(take)
+                    if read >= DOC_MAX_BYTES:
+                        logger.warning(f"[documents] {url} exceeds {DOC_MAX_BYTES} bytes, hashing the start only")
+                        break
+    except Exception as e:
+        logger.warning(f"[documents] Download failed for {url}: {e}")
+        return None, read
+    metrics.inc("document_bytes_total", read)
+    return h.hexdigest(), read
+
+
+class DocumentIndex:
+    """
+    Known linked documents per page, persisted in `page_documents`.
+
+    `check()` compares a page's current links with what was stored: new and
+    removed links are reported, and known files are re-hashed only when
+    their HEAD signals differ from last time. Files that answer without
+    any signal, and links that are gone (404/410), back off like pages do
+    (core.scheduler) instead of being fetched again on every run.
+    """
+
+    def __init__(self, rows: list[dict] | None = None):
+        self._lock = threading.Lock()
+        self._docs: dict = {}
+        for r in rows or []:
+            self._docs.setdefault(r["page_id"], {})[r["url"]] = dict(r)
+
+    @classmethod
+    def load(cls, page_ids: list, chunk: int = 100) -> "DocumentIndex":
+        from core.db import get_supabase
+        rows = []
+        try:
+            for i in range(0, len(page_ids), chunk):
+                rows += get_supabase().table("page_documents").select(
+                    "page_id, url, title, etag, last_modified, content_length, content_hash, "
+                    "change_rate, check_interval_s, next_due_at, failures"
+                ).in_("page_id", page_ids[i:i + chunk]).execute().data or []
+        except Exception as e:
+            logger.error(f"[documents] Could not load known documents: {e}")
+        return cls(rows)
+
+    def known(self, page_id) -> list[dict]:
+        with self._lock:
+            return list(self._docs.get(page_id, {}).values())
+
+    def _check_one(self, page_id, link: dict, old: dict | None, verify: bool, deadline: float) -> tuple[dict | None, bool]:
+        """
+        (document, changed) for one link. The document is None for a new
+        link that could not be read this run; an old one is kept as it was.
+        """
+        url = link["url"]
+        doc = {"page_id": page_id, "url": url, "title": link["title"],
+               **{k: old.get(k) if old else None for k in SIGNALS + ("content_hash",)},
+               **{k: old.get(k) if old else None for k in SCHEDULE}}
+        doc["failures"] = doc["failures"] or 0
+        if time.monotonic() > deadline:
+            metrics.inc("documents_total", result="deferred")
+            return (doc if old else None), False
+        if old and not scheduler.is_due(old):
+            metrics.inc("documents_total", result="backed_off")
+            return doc, False
+
+        signals, failure = probe(url, verify=verify)
+        if signals is None:
+            if failure == PERMANENT:
+                # Gone: grow the interval like a page that keeps answering 404
+                log = logger.debug if doc["failures"] else logger.warning
+                log(f"[documents] {url} is gone, backing off")
+                doc.update(scheduler.reschedule(doc, changed=False), failures=doc["failures"] + 1)
+                metrics.inc("documents_total", result="gone")
+                return doc, False
+            logger.warning(f"[documents] Could not reach {url} ({failure}), trying again later")
+            doc.update(scheduler.retry_later(doc), failures=doc["failures"] + 1)
+            metrics.inc("documents_total", result="failed")
+            return (doc if old else None), False
+
+        if old and old.get("content_hash") and _same_file(old, signals):
+            metrics.inc("documents_total", result="unchanged")
+            # A signal the server leaves out keeps its stored value (e.g. the size we counted)
+            doc.update({k: v for k, v in signals.items() if v is not None}, failures=0, next_due_at=None)
+            return doc, False
+
+        if time.monotonic() > deadline:
+            metrics.inc("documents_total", result="deferred")
+            return (doc if old else None), False
+        digest, size = content_hash(url, verify=verify, deadline=deadline)
+        if digest is None:
+            return (doc if old else None), False
+        changed = not old or digest != old.get("content_hash")
+        doc.update(signals, content_hash=digest, failures=0, next_due_at=None)
+        if doc["content_length"] is None:
+            doc["content_length"] = size
+        if not _has_signals(signals):
+            # Nothing to compare next time but the bytes: download it on the page schedule
+            doc.update(scheduler.reschedule(doc, changed=changed))
+        metrics.inc("documents_total", result="rehashed" if old else "new")
+        return doc, changed
+
+    def check(self, page_id, links: list[dict] | None, verify: bool = True,
+              deadline: float | None = None) -> dict:
+        """
+        Check a page's documents. `links` are the links found on the page,
+        or None to re-check the stored ones (when the page itself was not
+        re-parsed). Links are probed in parallel and the whole check stops
+        after DOC_CHECK_BUDGET_S (or at `deadline`, time.monotonic());
+        links it did not get to keep their stored state. Returns
+        {docs, rows, removed, changed}: the current documents, rows to
+        upsert, removed URLs, and whether anything differs from what was
+        stored.
+        """
+        with self._lock:
+            stored = dict(self._docs.get(page_id, {}))
+        if links is None:
+            links = [{"url": d["url"], "title": d["title"]} for d in stored.values()]
+        budget = time.monotonic() + DOC_CHECK_BUDGET_S
+        deadline = min(budget, deadline) if deadline else budget
+
+        results = run_bounded(
+            links,
+            lambda link: self._check_one(page_id, link, stored.get(link["url"]), verify, deadline),
+            key=lambda link: host_of(link["url"]),
+            max_workers=DOC_WORKERS,
+            per_key=DOC_PER_HOST,
+        )
+        checked = {}
+        for link, result, error in results:
+            if error:
+                logger.warning(f"[documents] Check failed for {link['url']}: {error}")
+                old = stored.get(link["url"])
+                result = (dict(old, title=link["title"]) if old else None), False
+            checked[link["url"]] = result
+
+        docs, rows, changed = [], [], False
+        # Page order, as the links were found
+        for link in links:
+            doc, doc_changed = checked[link["url"]]
+            if doc is None:
+                continue
+            docs.append(doc)
+            changed = changed or doc_changed
+            old = stored.get(link["url"])
+            if not old or any(doc[k] != old.get(k) for k in ("title", *SIGNALS, "content_hash", *SCHEDULE)):
+                rows.append(doc)
+
+        seen = {link["url"] for link in links}
+        removed = [url for url in stored if url not in seen]
+        return {"docs": docs, "rows": rows, "removed": removed, "changed": changed or bool(removed)}
+
+    def commit(self, page_id, docs: list[dict], removed: list[str]):
+        """Remember what was persisted, for later checks in this process."""
+        with self._lock:
+            page = self._docs.setdefault(page_id, {})
+            for url in removed:
+                page.pop(url, None)
+            for d in docs:
+                page[d["url"]] = dict(d)
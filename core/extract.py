@@ -0,0 +1,189 @@
+import re
+import copy
+import logging
+from lxml import etree, html as lxml_html
+from core import metrics
+from core.documents import document_links
+
+logger = logging.getLogger(__name__)
+
+# Hard cap on supplemental snippets to avoid noise
+MAX_SNIPPETS = 10
+# A region with less text than this is treated as missing
+REGION_MIN_LENGTH = 20
+
+
+def parse_html(html: str):
+    """Parse a document once into an lxml tree shared by every extraction step."""
+    try:
+        return lxml_html.fromstring(html)
+    except ValueError:
+        # lxml refuses str input that carries an XML encoding declaration
+        parser = lxml_html.HTMLParser(encoding="utf-8")
+        return lxml_html.fromstring(html.encode("utf-8"), parser=parser)
+
+
+def _text(el, sep: str = "") -> str:
+    """Stripped text of an element, joined like BeautifulSoup's get_text(sep, strip=True)."""
+    parts = (t.strip() for t in el.xpath(".//text()[not(ancestor::script or ancestor::style)]"))
+    return sep.join(p for p in parts if p)
+
+
+# Elements that start a new line in region text; cells only get a space
+BLOCK_TAGS = {
+    "p", "div", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "br", "hr",
+    "ul", "ol", "dl", "dt", "dd", "table", "thead", "tbody", "tfoot", "caption",
+    "section", "article", "header", "footer", "nav", "aside", "main",
+    "blockquote", "pre", "form", "fieldset", "figure", "figcaption", "address",
+}
+CELL_TAGS = {"td", "th"}
+
+
+def _block_text(el) -> str:
+    """
+    Text of an element with one line per block element (p, li, tr, h*, div...).
+    Inline tags (b, a, span...) stay inside their sentence.
+    """
+    parts = []
+
+    def walk(node):
+        tag = node.tag if isinstance(node.tag, str) else None
+        if tag in ("script", "style"):
+            pass
+        elif tag is not None:
+            sep = "\n" if tag in BLOCK_TAGS else " " if tag in CELL_TAGS else ""
+            parts.append(sep)
+            parts.append(node.text or "")
+            for child in node:
+                walk(child)
+            parts.append(sep)
+        parts.append(node.tail or "")
+
+    walk(el)
+    lines = (re.sub(r"\s+", " ", line).strip() for line in "".join(parts).split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def select_region(tree, selector: str) -> list:
+    """
+    Elements matching `selector`: XPath when it starts with "xpath:" or "/",
+    a CSS selector otherwise (via lxml.cssselect).
+    """
+    selector = selector.strip()
+    if selector.startswith("xpath:"):
+        matches = tree.xpath(selector[len("xpath:"):].strip())
+    elif selector.startswith("/"):
+        matches = tree.xpath(selector)
+    else:
+        from lxml.cssselect import CSSSelector
+        matches = CSSSelector(selector)(tree)
+    # XPath can also select text or attributes; only elements make a region
+    return [m for m in matches if isinstance(m, lxml_html.HtmlElement)]
+
+
+def region_tree(tree, selector: str):
+    """
+    A standalone document holding copies of the matched elements, so every
+    later step (including `//` queries) sees only the region. Returns None
+    when the selector is invalid or matches nothing.
+    """
+    try:
+        matches = select_region(tree, selector)
+    except Exception as e:
+        logger.warning(f"[extract] Invalid region selector {selector!r}: {e}")
+        return None
+    # Keep outermost matches only, so nested ones aren't counted twice
+    matches = [m for m in matches if not any(a in matches for a in m.iterancestors())]
+    if not matches:
+        logger.warning(f"[extract] Region selector {selector!r} matched nothing")
+        return None
+
+    root = lxml_html.Element("html")
+    body = etree.SubElement(root, "body")
+    for m in matches:
+        part = copy.deepcopy(m)
+        part.tail = None
+        body.append(part)
+    return root
+
+
+def supplemental_snippets(tree) -> str:
+    """
+    Extract small, high-signal snippets that trafilatura may drop.
+    Returns a compact string (NOT full HTML).
+    """
+    snippets = []
+
+    # Headings (often contain notices)
+    for tag in tree.xpath("//h1 | //h2 | //h3 | //h4"):
+        text = _text(tag)
+        if len(text) > 20:
+            snippets.append(f"[HEADING] {text}")
+
+    # Tables (dates, schedules)
+    for table in tree.xpath("//table"):
+        table_text = _text(table, " ")
+        if len(table_text) > 50:
+            snippets.append(f"[TABLE] {table_text[:800]}")
+
+    # Strong / emphasized notices
+    for tag in tree.xpath("//strong | //b"):
+        text = _text(tag)
+        if len(text) > 20:
+            snippets.append(f"[NOTICE] {text}")
+
+    return "\n".join(snippets[:MAX_SNIPPETS])
+
+
+def build_content(main_text: str, supplemental: str) -> str:
+    """The stored/hashed page representation."""
+    return (
+        "PRIMARY_CONTENT:\n"
+        + main_text
+        + "\n\nSUPPLEMENTAL_SNIPPETS:\n"
+        + supplemental
+    )
+
+
+def extract_page(html: str, min_length: int = 500, region: str | None = None,
+                 base_url: str | None = None) -> tuple[str | None, list[dict]]:
+    """
+    Parse `html` once and build the page content from that single tree.
+    Returns (content, document links); content is None when the main text
+    is shorter than `min_length`. Links to PDFs, images and office files
+    (core.documents) are collected from the same scope as the content.
+
+    With a `region` selector only the matched elements are used, and all of
+    their text is the primary content (the block was chosen by hand, so
+    trafilatura's boilerplate filter is skipped). If the region is missing
+    or empty the whole document is used instead.
+    """
+    with metrics.timer("extract_seconds"):
+        try:
+            tree = parse_html(html)
+        except Exception as e:
+            logger.error(f"[extract] Could not parse HTML: {e}")
+            return None, []
+
+        if region:
+            scoped = region_tree(tree, region)
+            main_text = _block_text(scoped) if scoped is not None else ""
+            if len(main_text) >= REGION_MIN_LENGTH:
+                return build_content(main_text, supplemental_snippets(scoped)), document_links(scoped, base_url)
+            metrics.inc("region_fallback_total")
+            logger.warning(f"[extract] Falling back to the whole page for region {region!r}")
+
+        # Snippets and links first: trafilatura may prune the tree it is given
+        supplemental = supplemental_snippets(tree)
+        links = document_links(tree, base_url)
+        from trafilatura import extract  # heavy; only needed once a page is fetched
+        main_text = extract(tree)
+
+    if main_text and len(main_text) > min_length:
+        return build_content(main_text, supplemental), links
+    return None, links
+
+
+def extract_content(html: str, min_length: int = 500, region: str | None = None) -> str | None:
+    """The content part of `extract_page`."""
+    return extract_page(html, min_length, region)[0]
@@ -0,0 +1,165 @@
+import os
+import re
+import hashlib
+import logging
+from core.utils import get_text_hash
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+# Max SimHash bit distance still treated as cosmetic churn. Negative disables
+# near-duplicate matching: on long pages a one-word edit ("open" -> "closed")
+# barely moves the SimHash, so pages opt in via monitored_pages.simhash_threshold.
+SIMHASH_THRESHOLD = int(os.getenv("SIMHASH_THRESHOLD", "-1"))
+SHINGLE_SIZE = 3
+
+_MONTHS = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?"
+_DATE = (
+    rf"(?:\d{{1,2}}[-/.]\d{{1,2}}[-/.]\d{{2,4}}"
+    rf"|\d{{4}}-\d{{2}}-\d{{2}}"
+    rf"|\d{{1,2}}(?:st|nd|rd|th)?\s+{_MONTHS},?\s+\d{{4}}"
+    rf"|{_MONTHS}\s+\d{{1,2}}(?:st|nd|rd|th)?,?\s+\d{{4}})"
+)
+_TIME = r"\d{1,2}:\d{2}(?::\d{2})?\s*(?:am|pm)?"
+
+# Named normalizers. Each maps noise to a fixed token so it never registers as a change.
+NORMALIZERS = {
+    # "Copyright © 2024-2025", "© 2025"
+    "copyright": (re.compile(r"(?:copyright|©|\(c\))\s*(?:©\s*)?\d{4}(?:\s*[-–]\s*\d{4})?", re.I), "<copyright>"),
+    # "Visitors: 1,234", "Page views 5678", "Hits: 99"
+    "counters": (re.compile(r"\b(?:visitors?|visits|views|page\s*views|hits)\s*:?\s*[\d,]+", re.I), "<counter>"),
+    # A "Last updated: 14 Oct 2026 09:31" footer on its own line. "Deadline
+    # updated: 25 October" must stay a change, so "last" and the line anchors are required.
+    "updated": (re.compile(
+        rf"^[ \t]*last\s+(?:updated|modified)(?:\s+on)?\s*:?\s*(?:{_DATE})?\s*(?:{_TIME})?[ \t]*$", re.I | re.M
+    ), "<updated>"),
+    # "5 minutes ago"
+    "relative": (re.compile(r"\b\d+\s+(?:seconds?|minutes?|hours?|days?)\s+ago\b", re.I), "<ago>"),
+    # Opt-in only: these can hide real deadline/fee/exam-time changes
+    "times": (re.compile(_TIME, re.I), "<time>"),
+    "dates": (re.compile(_DATE, re.I), "<date>"),
+    "numbers": (re.compile(r"\d[\d,.]*"), "<n>"),
+}
+DEFAULT_NORMALIZERS = ("copyright", "counters", "updated", "relative")
+
+_pattern_cache: dict[str, re.Pattern | None] = {}
+
+
+def _compile(pattern: str) -> re.Pattern | None:
+    if pattern not in _pattern_cache:
+        try:
+            _pattern_cache[pattern] = re.compile(pattern, re.I)
+        except re.error as e:
+            logger.warning(f"[fingerprint] Ignoring invalid noise pattern {pattern!r}: {e}")
+            _pattern_cache[pattern] = None
+    return _pattern_cache[pattern]
+
+
+def normalize(text: str, normalizers=None, noise_patterns=None) -> str:
+    """
+    Remove page noise before hashing.
+    `normalizers` are names from NORMALIZERS (defaults to DEFAULT_NORMALIZERS);
+    `noise_patterns` are extra user-supplied regexes, removed outright.
+    """
+    if not text:
+        return ""
+    for name in normalizers if normalizers is not None else DEFAULT_NORMALIZERS:
+        if name not in NORMALIZERS:
+            logger.warning(f"[fingerprint] Unknown normalizer {name!r}")
+            continue
+        regex, token = NORMALIZERS[name]
+        text = regex.sub(token, text)
+    for pattern in noise_patterns or []:
+        regex = _compile(pattern)
+        if regex:
+            text = regex.sub("", text)
+    return text
+
+
+def simhash(text: str, k: int = SHINGLE_SIZE) -> int:
+    """64-bit SimHash over k-word shingles."""
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return 0
+    shingles = (
+        [" ".join(words[i:i + k]) for i in range(len(words) - k + 1)]
+        if len(words) >= k else [" ".join(words)]
+    )
+    weights = [0] * 64
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _numbers_hash(text: str) -> str:
+    # Multiset of numbers left after normalization (dates, fees, seats, ...)
+    numbers = sorted(re.findall(r"\d+", text))
+    return hashlib.sha256(" ".join(numbers).encode()).hexdigest()[:16]
+
+
+def fingerprint(text: str, normalizers=None, noise_patterns=None, with_simhash: bool = True) -> dict:
+    """
+    Noise-tolerant fingerprint of page content:
+    {"hash": exact hash of normalized text, "simhash": 16-hex-digit SimHash
+     (None without `with_simhash`), "numbers_hash": hash of the numbers it contains}
+    """
+    clean = normalize(text, normalizers, noise_patterns)
+    return {
+        "hash": get_text_hash(clean),
+        "simhash": f"{simhash(clean):016x}" if with_simhash else None,
+        "numbers_hash": _numbers_hash(clean),
+    }
+
+
+def _uses_simhash(page: dict) -> bool:
+    """Whether near-duplicate matching is on for a page; the SimHash is costly, so skip it otherwise."""
+    threshold = page.get("simhash_threshold")
+    return (SIMHASH_THRESHOLD if threshold is None else threshold) >= 0
+
+
+def page_fingerprint(page: dict, text: str) -> dict:
+    """Fingerprint `text` with the normalizers configured on a monitored_pages row."""
+    with metrics.timer("fingerprint_seconds"):
+        return fingerprint(text, page.get("normalizers"), page.get("noise_patterns"), _uses_simhash(page))
+
+
+def stored_fingerprint(page: dict) -> dict | None:
+    """
+    The fingerprint saved on a monitored_pages row, recomputed from
+    last_content for older rows (no numbers_hash) and for rows stored
+    without a SimHash once the page needs one.
+    """
+    if page.get("numbers_hash") and (page.get("simhash") or not _uses_simhash(page) or not page.get("last_content")):
+        return {
+            "hash": page.get("content_hash"),
+            "simhash": page.get("simhash"),
+            "numbers_hash": page["numbers_hash"],
+        }
+    if page.get("last_content"):
+        return page_fingerprint(page, page["last_content"])
+    return None
+
+
+def is_cosmetic(old_fp: dict | None, new_fp: dict, threshold: int | None = None) -> bool:
+    """
+    True when the new version is a near-duplicate of the old one: SimHash
+    distance within `threshold` and no number on the page changed. Any
+    changed number (a date, a fee, a seat count) always counts as real.
+    """
+    if not old_fp:
+        return False
+    if threshold is None:
+        threshold = SIMHASH_THRESHOLD
+    if threshold < 0:
+        return False
+    if old_fp["numbers_hash"] != new_fp["numbers_hash"]:
+        return False
+    if not (old_fp["simhash"] and new_fp["simhash"]):
+        return False
+    return hamming(int(old_fp["simhash"], 16), int(new_fp["simhash"], 16)) <= threshold
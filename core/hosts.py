@@ -0,0 +1,88 @@
+import logging
+import threading
+from core.db import get_supabase
+from core.concurrency import host_of
+from core.retry import PERMANENT
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest sample in the typical-latency moving average
+LATENCY_ALPHA = 0.3
+
+
+class HostProfiles:
+    """
+    Per-host memory of which fetch strategy works, persisted in `host_profiles`.
+
+    Each profile records the last successful strategy, whether verified SSL
+    works and a typical latency. A failure clears the remembered strategy so
+    the next fetch walks the whole ladder again, except a gone page (404/410)
+    or a fetch the circuit breaker skipped: neither says the host misbehaved.
+    """
+
+    def __init__(self, rows: list[dict] | None = None):
+        self._lock = threading.Lock()
+        self._profiles = {r["host"]: dict(r) for r in rows or []}
+        self._dirty: set[str] = set()
+
+    @classmethod
+    def load(cls) -> "HostProfiles":
+        try:
+            rows = get_supabase().table("host_profiles").select(
+                "host, strategy, ssl_ok, latency_ms, failures"
+            ).execute().data or []
+        except Exception as e:
+            logger.error(f"[hosts] Could not load host profiles: {e}")
+            rows = []
+        return cls(rows)
+
+    def strategy_for(self, url: str) -> str | None:
+        with self._lock:
+            profile = self._profiles.get(host_of(url))
+            return profile.get("strategy") if profile else None
+
+    def record(self, url: str, result: dict):
+        """Update the host's profile from a core.scraper.fetch_page result."""
+        if result["status"] == "failed" and (result.get("error") == PERMANENT or result.get("short_circuited")):
+            return
+        host = host_of(url)
+        with self._lock:
+            profile = self._profiles.setdefault(host, {
+                "host": host, "strategy": None, "ssl_ok": None,
+                "latency_ms": None, "failures": 0,
+            })
+
+            if result["status"] == "failed":
+                profile["strategy"] = None
+                profile["failures"] = (profile.get("failures") or 0) + 1
+            else:
+                strategy = result["strategy"]
+                profile["strategy"] = strategy
+                profile["failures"] = 0
+                if strategy == "cloudscraper":
+                    profile["ssl_ok"] = True
+                elif strategy == "insecure":
+                    profile["ssl_ok"] = False
+
+                latency = result.get("latency_ms")
+                if latency is not None:
+                    prev = profile.get("latency_ms")
+                    profile["latency_ms"] = latency if prev is None else int(
+                        LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * prev
+                    )
+
+            self._dirty.add(host)
+
+    def save(self):
+        """Upsert every profile touched during this run."""
+        with self._lock:
+            rows = [
+                {**self._profiles[h], "updated_at": "now()"} for h in self._dirty
+            ]
+            self._dirty.clear()
+        if not rows:
+            return
+        try:
+            get_supabase().table("host_profiles").upsert(rows, on_conflict="host").execute()
+        except Exception as e:
+            logger.error(f"[hosts] Could not save host profiles: {e}")
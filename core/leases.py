@@ -0,0 +1,136 @@
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+LEASE_BACKEND = os.getenv("LEASE_BACKEND", "supabase")  # "supabase" | "local" | "off"
+LEASE_PATH = os.getenv("LEASE_PATH", ".cache/leases.sqlite3")
+# A crashed worker's pages become claimable again after this long
+LEASE_TTL_S = int(os.getenv("LEASE_TTL_S", "900"))
+# Pages claimed (and checkpointed) at a time
+LEASE_BATCH = int(os.getenv("LEASE_BATCH", "25"))
+# Static split of the source list between workers: page id % WORKER_SHARDS
+WORKER_SHARD = int(os.getenv("WORKER_SHARD", "0"))
+WORKER_SHARDS = int(os.getenv("WORKER_SHARDS", "1"))
+
+
+def worker_id() -> str:
+    """Lease owner name for this process; WORKER_ID overrides it."""
+    return os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def in_shard(page: dict, shard: int = WORKER_SHARD, shards: int = WORKER_SHARDS) -> bool:
+    return shards <= 1 or int(page["id"]) % shards == shard
+
+
+class LeaseStore(ABC):
+    """
+    Time-limited claims on pages, so concurrent workers never check the
+    same page at once. A claim is atomic: of the candidate ids, only those
+    nobody holds an unexpired lease on are granted.
+    """
+
+    @abstractmethod
+    def claim(self, owner: str, ids: list, ttl_s: int = LEASE_TTL_S, due_only: bool = True) -> set:
+        """
+        Lease as many of `ids` as are free; returns the ids granted. With
+        `due_only`, pages another worker already checked (no longer due) are
+        refused too; manual scans pass False.
+        """
+
+    @abstractmethod
+    def release(self, owner: str, ids: list):
+        """Drop `owner`'s leases on `ids`, so the pages can be claimed at once."""
+
+
+class LocalLeaseStore(LeaseStore):
+    """SQLite stand-in for local runs: workers on one machine share the file."""
+
+    def __init__(self, path: str = LEASE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        # Autocommit; transactions are opened explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("""
+            create table if not exists page_leases (
+                page_id text primary key, owner text not null, expires_at real not null
+            )
+        """)
+
+    def claim(self, owner, ids, ttl_s=LEASE_TTL_S, due_only=True):
+        # Due dates live in the page table, not here: only held leases are refused
+        now = time.time()
+        granted = set()
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock, so other processes wait
+            self._conn.execute("begin immediate")
+            try:
+                for page_id in ids:
+                    row = self._conn.execute(
+                        "select owner, expires_at from page_leases where page_id = ?", (str(page_id),)
+                    ).fetchone()
+                    if row and row[0] != owner and row[1] > now:
+                        continue
+                    self._conn.execute(
+                        "insert or replace into page_leases values (?, ?, ?)",
+                        (str(page_id), owner, now + ttl_s),
+                    )
+                    granted.add(page_id)
+                self._conn.execute("commit")
+            except Exception:
+                self._conn.execute("rollback")
+                raise
+        return granted
+
+    def release(self, owner, ids):
+        if not ids:
+            return
+        with self._lock:
+            self._conn.execute(
+                f"delete from page_leases where owner = ? and page_id in ({','.join('?' * len(ids))})",
+                [owner, *map(str, ids)],
+            )
+
+
+class SupabaseLeaseStore(LeaseStore):
+    """Leases on monitored_pages.lease_owner / lease_expires_at via the claim_pages function."""
+
+    def __init__(self):
+        from core.db import get_supabase
+        self._db = get_supabase()
+
+    def claim(self, owner, ids, ttl_s=LEASE_TTL_S, due_only=True):
+        if not ids:
+            return set()
+        rows = self._db.rpc(
+            "claim_pages", {"p_owner": owner, "p_ids": list(ids), "p_ttl_s": ttl_s, "p_due_only": due_only}
+        ).execute().data or []
+        # setof bigint comes back as plain values or {"claim_pages": id}
+        return {r["claim_pages"] if isinstance(r, dict) else r for r in rows}
+
+    def release(self, owner, ids):
+        if not ids:
+            return
+        self._db.table("monitored_pages").update(
+            {"lease_owner": None, "lease_expires_at": None}
+        ).eq("lease_owner", owner).in_("id", list(ids)).execute()
+
+
+_store: LeaseStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_lease_store() -> LeaseStore | None:
+    """Process-wide store chosen by LEASE_BACKEND; None when leasing is off."""
+    global _store
+    with _store_lock:
+        if _store is None and LEASE_BACKEND != "off":
+            _store = LocalLeaseStore() if LEASE_BACKEND == "local" else SupabaseLeaseStore()
+        return _store
@@ -0,0 +1,305 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+# Gemini free/paid tier limits; tune per key
+LLM_RPM = int(os.getenv("LLM_RPM", "10"))
+LLM_TPM = int(os.getenv("LLM_TPM", "250000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+
+
+class LLMUnavailableError(Exception):
+    """The model could not be reached (quota, outage, bad key) after retries."""
+
+
+class LLMBlockedError(Exception):
+    """The model refused the prompt (safety block); asking again gives the same answer."""
+
+
+# ---------- Backends ----------
+class LLMBackend(ABC):
+    """Minimal interface every model backend implements."""
+
+    name = "base"
+
+    @abstractmethod
+    async def generate(self, prompt: str) -> str:
+        """The model's raw text answer to `prompt`."""
+
+
+# Finish reasons of a candidate withheld by the safety filters
+_BLOCKED_FINISH = ("SAFETY", "BLOCKLIST", "PROHIBITED_CONTENT", "SPII")
+
+
+class GeminiBackend(LLMBackend):
+    def __init__(self, model_name: str, api_key: str | None = None):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key or os.getenv("GEMINI_API_KEY"))
+        self.name = model_name
+        self._model = genai.GenerativeModel(
+            model_name,
+            generation_config={
+                "temperature": 0.1,
+                "top_p": 0.9
+            }
+        )
+
+    async def generate(self, prompt: str) -> str:
+        try:
+            response = await self._model.generate_content_async(prompt)
+        except Exception as e:
+            if type(e).__name__ in ("BlockedPromptException", "StopCandidateException"):
+                raise LLMBlockedError(str(e)) from e
+            raise
+        feedback = getattr(response, "prompt_feedback", None)
+        if feedback is not None and getattr(feedback, "block_reason", 0):
+            raise LLMBlockedError(f"prompt blocked: {feedback.block_reason}")
+        candidates = getattr(response, "candidates", None) or []
+        reasons = [getattr(c.finish_reason, "name", str(c.finish_reason)) for c in candidates]
+        if reasons and all(r in _BLOCKED_FINISH for r in reasons):
+            raise LLMBlockedError(f"response blocked: {reasons[0]}")
+        return response.text or ""
+
+
+class FakeBackend(LLMBackend):
+    """
+    Deterministic offline stand-in for tests and benchmarks.
+
+    Marks a page meaningful when an added/removed line mentions a deadline,
+    fee, merit list, eligibility or admission keyword. Understands both the
+    single-page and the batch prompt formats.
+    """
+
+    name = "fake"
+    KEYWORDS = ("deadline", "last date", "fee", "challan", "merit", "eligib", "admission", "datesheet")
+
+    def __init__(self, latency_s: float = 0.0):
+        self.latency_s = latency_s
+        self.calls = 0
+
+    def _analyze(self, section: str) -> dict:
+        changed = [
+            line[2:] for line in section.splitlines()
+            if line.startswith(("+ ", "- "))
+        ] or section.splitlines()
+        hits = [line for line in changed if any(k in line.lower() for k in self.KEYWORDS)]
+        return {
+            "is_meaningful": bool(hits),
+            "summary": [line[:200] for line in hits[:3]] if hits else [],
+            "confidence": 0.9 if hits else 0.8,
+        }
+
+    async def generate(self, prompt: str) -> str:
+        self.calls += 1
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        body = prompt.split("Mark is_meaningful", 1)[0]
+        pages = re.split(r"^=== PAGE (\d+) ===$", body, flags=re.MULTILINE)
+        if len(pages) > 1:
+            return json.dumps([
+                {"id": int(pid), **self._analyze(section)}
+                for pid, section in zip(pages[1::2], pages[2::2])
+            ])
+        return json.dumps(self._analyze(body))
+
+
+# ---------- Rate limiting ----------
+class TokenBucket:
+    """Async token bucket refilled continuously at `per_minute` units per minute."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = max(1.0, float(per_minute))
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1.0):
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+# ---------- Retry classification ----------
+# google.api_core.exceptions raised by the Gemini SDK, matched by class name
+# so the SDK stays a lazy import
+_RETRYABLE_ERRORS = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+    "DeadlineExceeded", "InternalServerError", "GatewayTimeout",
+}
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+_RETRY_HINT = re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)|retry in\s*([\d.]+)\s*s", re.I)
+
+
+def _is_retryable(e: Exception) -> bool:
+    """By exception type or HTTP status only: messages of permanent errors can mention "500" too."""
+    if isinstance(e, LLMBlockedError):
+        return False
+    if isinstance(e, (asyncio.TimeoutError, ConnectionError, TimeoutError)):
+        return True
+    if any(cls.__name__ in _RETRYABLE_ERRORS for cls in type(e).__mro__):
+        return True
+    code = getattr(e, "code", None)
+    return isinstance(code, int) and code in _RETRYABLE_STATUS
+
+
+def _retry_hint(e: Exception) -> float | None:
+    """Server-suggested wait in seconds, if the error carries one."""
+    match = _RETRY_HINT.search(str(e))
+    if not match:
+        return None
+    return float(match.group(1) or match.group(2))
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+class AsyncLLMClient:
+    """
+    Rate-limited, retrying front for an LLMBackend.
+
+    Requests and (estimated) prompt tokens per minute are limited with token
+    buckets, at most `max_concurrency` calls are in flight, and retryable
+    errors back off exponentially with jitter, waiting at least as long as
+    any retry hint from the server. Exhausted or permanent failures raise
+    LLMUnavailableError instead of passing as "not meaningful"; safety
+    blocks raise LLMBlockedError at once.
+
+    The client owns a private event loop thread, so synchronous callers on
+    any thread can use `run()`.
+    """
+
+    def __init__(self, backend: LLMBackend, rpm: int = LLM_RPM, tpm: int = LLM_TPM,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, max_retries: int = LLM_MAX_RETRIES,
+                 base_delay: float = 2.0, max_delay: float = 60.0):
+        self.backend = backend
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def model_name(self) -> str:
+        return self.backend.name
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="llm-client", daemon=True
+                )
+                self._thread.start()
+                # Loop-bound primitives are created on the loop they serve
+                asyncio.run_coroutine_threadsafe(self._init_limits(), self._loop).result()
+
+    async def _init_limits(self):
+        self._requests = TokenBucket(self.rpm)
+        self._tokens = TokenBucket(self.tpm)
+        self._sem = asyncio.Semaphore(self.max_concurrency)
+
+    def run(self, coro):
+        """Run a coroutine on the client's loop and block for its result."""
+        self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def generate(self, prompt: str) -> str:
+        """Must be awaited on the client's loop (see run())."""
+        tokens = estimate_tokens(prompt)
+        for attempt in range(self.max_retries + 1):
+            await self._requests.acquire()
+            await self._tokens.acquire(tokens)
+            try:
+                async with self._sem:
+                    with metrics.timer("llm_request_seconds", backend=self.model_name) as labels:
+                        labels["outcome"] = "error"
+                        text = await self.backend.generate(prompt)
+                        labels["outcome"] = "ok"
+                metrics.inc("llm_prompt_tokens_total", tokens, backend=self.model_name)
+                metrics.inc("llm_response_tokens_total", estimate_tokens(text or ""), backend=self.model_name)
+                return text
+            except LLMBlockedError:
+                metrics.inc("llm_failures_total", backend=self.model_name, reason="blocked")
+                raise
+            except Exception as e:
+                if not _is_retryable(e):
+                    metrics.inc("llm_failures_total", backend=self.model_name, reason="permanent")
+                    raise LLMUnavailableError(f"{self.model_name}: {e}") from e
+                if attempt == self.max_retries:
+                    metrics.inc("llm_failures_total", backend=self.model_name, reason="retries_exhausted")
+                    raise LLMUnavailableError(
+                        f"{self.model_name}: gave up after {attempt + 1} attempts: {e}"
+                    ) from e
+
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+                delay = random.uniform(delay / 2, delay)
+                hint = _retry_hint(e)
+                if hint is not None:
+                    delay = max(delay, hint)
+                metrics.inc("llm_retries_total", backend=self.model_name)
+                logger.warning(f"[llm] Retryable error ({e}); retry {attempt + 1} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def close(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop.close()
+            self._loop = None
+            self._thread = None
+
+
+_client: AsyncLLMClient | None = None
+_client_lock = threading.Lock()
+
+
+def make_backend(model_name: str) -> LLMBackend:
+    """Pick the backend from LLM_BACKEND ("gemini" by default, or "fake")."""
+    kind = os.getenv("LLM_BACKEND", "gemini").lower()
+    if kind == "fake":
+        return FakeBackend(latency_s=float(os.getenv("FAKE_LLM_LATENCY_S", "0")))
+    return GeminiBackend(model_name)
+
+
+def get_client(model_name: str) -> AsyncLLMClient:
+    """Process-wide client, built on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = AsyncLLMClient(make_backend(model_name))
+        return _client
+
+
+def set_client(client: AsyncLLMClient | None):
+    """Swap the process-wide client (e.g. for a FakeBackend in benchmarks)."""
+    global _client
+    with _client_lock:
+        if _client is not None and _client is not client:
+            _client.close()
+        _client = client
@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm_cache.sqlite3")
+MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+MAX_AGE_DAYS = float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "90"))
+
+
+class AnalysisCache:
+    """
+    On-disk cache of LLM analyses keyed by (model, prompt version, diff digest).
+
+    Entries older than `max_age_days` are dropped, and the least recently
+    used entries go first once there are more than `max_entries`.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = MAX_ENTRIES,
+                 max_age_days: float = MAX_AGE_DAYS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_s = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            create table if not exists analyses (
+                key text primary key,
+                value text not null,
+                created_at real not null,
+                last_used real not null
+            )
+        """)
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(model: str, prompt_version: str, diff_digest: str) -> str:
+        return hashlib.sha256(f"{model}\0{prompt_version}\0{diff_digest}".encode()).hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "select value, created_at from analyses where key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age_s:
+                self.misses += 1
+                metrics.inc("llm_cache_total", result="miss")
+                return None
+            self._conn.execute("update analyses set last_used = ? where key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        metrics.inc("llm_cache_total", result="hit")
+        return json.loads(row[0])
+
+    def put(self, key: str, value: dict):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "insert or replace into analyses (key, value, created_at, last_used) values (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self._conn.commit()
+
+    def evict(self):
+        """Apply the age and size limits."""
+        with self._lock:
+            self._conn.execute(
+                "delete from analyses where created_at < ?", (time.time() - self.max_age_s,)
+            )
+            self._conn.execute("""
+                delete from analyses where key in (
+                    select key from analyses order by last_used desc limit -1 offset ?
+                )
+            """, (self.max_entries,))
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute("select count(*) from analyses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": size}
+
+    def close(self):
+        self.evict()
+        with self._lock:
+            self._conn.close()
+
+
+_cache: AnalysisCache | None = None
+_cache_disabled = False
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> AnalysisCache | None:
+    """Process-wide cache; None if it cannot be opened (the analyzer then runs uncached)."""
+    global _cache, _cache_disabled
+    with _cache_lock:
+        if _cache is None and not _cache_disabled:
+            try:
+                _cache = AnalysisCache(CACHE_PATH)
+            except Exception as e:
+                logger.error(f"[llm-cache] Disabled, could not open {CACHE_PATH}: {e}")
+                _cache_disabled = True
+        return _cache
+
+
+def close_cache():
+    """Evict and close the process-wide cache, if open."""
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+            _cache = None
@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Run report locations; the .prom file suits node_exporter's textfile collector.
+# Kept out of .cache, which CI restores from the previous run.
+METRICS_JSON_PATH = os.getenv("METRICS_JSON_PATH", ".metrics/run_report.json")
+METRICS_PROM_PATH = os.getenv("METRICS_PROM_PATH", ".metrics/worker.prom")
+METRICS_PREFIX = "nustify_"
+# Hosts listed in the report's slowest-hosts table
+TOP_HOSTS = 10
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _pct(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def _prom_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    def esc(v):
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels) + "}"
+
+
+class Registry:
+    """
+    Counters and timers for one run, keyed by name plus labels.
+
+    Timers keep every sample (a run is a few thousand at most) so the
+    report can give exact percentiles. Safe to use from any thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self._counters: dict[tuple, float] = {}
+            self._timers: dict[tuple, list[float]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._timers.setdefault(key, []).append(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Time a block; labels may be filled in inside it (e.g. an outcome)."""
+        started = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    # ---------- reporting ----------
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            timers = {k: list(v) for k, v in self._timers.items()}
+        finished_at = time.time()
+
+        report = {
+            "started_at": self.started_at,
+            "finished_at": finished_at,
+            "duration_s": round(finished_at - self.started_at, 3),
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(counters.items())
+            ],
+            "timers": [
+                {
+                    "name": name, "labels": dict(labels), "count": len(values),
+                    "sum_s": round(sum(values), 4),
+                    "p50_s": round(_pct(values, 50), 4),
+                    "p90_s": round(_pct(values, 90), 4),
+                    "p99_s": round(_pct(values, 99), 4),
+                    "max_s": round(max(values), 4),
+                }
+                for (name, labels), values in sorted(timers.items())
+            ],
+        }
+
+        # Where the fetch time went, summed over strategies
+        per_host: dict[str, float] = {}
+        for t in report["timers"]:
+            if t["name"] == "fetch_seconds" and "host" in t["labels"]:
+                per_host[t["labels"]["host"]] = per_host.get(t["labels"]["host"], 0) + t["sum_s"]
+        report["slowest_hosts"] = [
+            {"host": h, "fetch_s": round(s, 3)}
+            for h, s in sorted(per_host.items(), key=lambda x: -x[1])[:TOP_HOSTS]
+        ]
+        return report
+
+    @staticmethod
+    def to_prometheus(report: dict) -> str:
+        lines = []
+        typed = set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for c in report["counters"]:
+            name = METRICS_PREFIX + c["name"]
+            header(name, "counter")
+            lines.append(f"{name}{_prom_labels(tuple(c['labels'].items()))} {c['value']}")
+
+        for t in report["timers"]:
+            name = METRICS_PREFIX + t["name"]
+            header(name, "summary")
+            labels = tuple(t["labels"].items())
+            for q, field in (("0.5", "p50_s"), ("0.9", "p90_s"), ("0.99", "p99_s")):
+                lines.append(f"{name}{_prom_labels(labels + (('quantile', q),))} {t[field]}")
+            lines.append(f"{name}_sum{_prom_labels(labels)} {t['sum_s']}")
+            lines.append(f"{name}_count{_prom_labels(labels)} {t['count']}")
+
+        for name, value in (("run_duration_seconds", report["duration_s"]),
+                            ("run_finished_timestamp_seconds", round(report["finished_at"]))):
+            header(METRICS_PREFIX + name, "gauge")
+            lines.append(f"{METRICS_PREFIX}{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, json_path: str | None = None, prom_path: str | None = None) -> dict:
+        """Write the JSON report and Prometheus textfile; returns the report."""
+        report = self.snapshot()
+        for path, text in (
+            (json_path or METRICS_JSON_PATH, json.dumps(report, indent=2)),
+            (prom_path or METRICS_PROM_PATH, self.to_prometheus(report)),
+        ):
+            try:
+                if os.path.dirname(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write then rename so collectors never read a partial file
+                tmp = f"{path}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(text)
+                os.replace(tmp, path)
+            except OSError as e:
+                logger.error(f"[metrics] Could not write {path}: {e}")
+        return report
+
+
+def clear_report(json_path: str | None = None, prom_path: str | None = None):
+    """Remove an earlier run's report, so a crashed run never publishes stale numbers."""
+    for path in (json_path or METRICS_JSON_PATH, prom_path or METRICS_PROM_PATH):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"[metrics] Could not remove {path}: {e}")
+
+
+_registry = Registry()
+
+inc = _registry.inc
+observe = _registry.observe
+timer = _registry.timer
+reset = _registry.reset
+snapshot = _registry.snapshot
+write_report = _registry.write_report
@@ -1,13 +1,25 @@
 import os
+import html as html_lib
+import logging
 import smtplib
 from email.message import EmailMessage
-from core.db import supabase
+from core.db import get_supabase
+from core import metrics
 
-def send_alert(title, summary, url):
-    subs = supabase.table("email_subscribers").select("email").execute().data
-    if not subs:
-        return
+logger = logging.getLogger(__name__)
+
+# Recipients per message; most providers cap RCPT TO per message (Gmail: 100)
+SMTP_MAX_RECIPIENTS = int(os.getenv("SMTP_MAX_RECIPIENTS", "50"))
+# Merge all alerts of a run into one email
+ALERT_DIGEST = os.getenv("ALERT_DIGEST", "0") == "1"
+# Give up on a queued email after this many failed sends
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+# A claimed queued email is left to its worker this long before another may retry it
+OUTBOX_CLAIM_TTL_S = int(os.getenv("OUTBOX_CLAIM_TTL_S", "600"))
 
+
+def _format(summary, url) -> tuple[str, str]:
+    """Plain-text and HTML bodies for one alert."""
     if isinstance(summary, list):
         plain = "\n".join(f"• {s}" for s in summary)
         html = "<ul>" + "".join(f"<li>{s}</li>" for s in summary) + "</ul>"
@@ -20,19 +32,202 @@ def send_alert(title, summary, url):
         plain += f"\n\nPage link:\n{url}"
         html += f'<br><br><a href="{url}" target="_blank">{url}</a>'
 
-    msg = EmailMessage()
-    msg["Subject"] = f"🚨 NUSTIFY-SENTINEL Alert: {title}"
-    msg["From"] = os.getenv("SENDER_EMAIL")
-    msg["To"] = ", ".join(s["email"] for s in subs)
-    msg.set_content(plain)
-    msg.add_alternative(html, subtype="html")
-
-    with smtplib.SMTP_SSL(
-        os.getenv("SMTP_SERVER"),
-        int(os.getenv("SMTP_PORT"))
-    ) as smtp:
-        smtp.login(
-            os.getenv("SENDER_EMAIL"),
-            os.getenv("SENDER_PASSWORD")
-        )
-        smtp.send_message(msg)
+    return plain, html
+
+
+def _is_transient(e: Exception) -> bool:
+    if isinstance(e, smtplib.SMTPResponseException):
+        return 400 <= e.smtp_code < 500
+    return isinstance(e, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError))
+
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), max(1, size)):
+        yield items[i:i + size]
+
+
+class _SmtpSession:
+    """One authenticated SMTP_SSL connection, opened lazily and reopened once if dropped."""
+
+    def __init__(self):
+        self._smtp = None
+
+    def _connect(self):
+        with metrics.timer("smtp_connect_seconds"):
+            self._smtp = smtplib.SMTP_SSL(
+                os.getenv("SMTP_SERVER"),
+                int(os.getenv("SMTP_PORT"))
+            )
+            self._smtp.login(
+                os.getenv("SENDER_EMAIL"),
+                os.getenv("SENDER_PASSWORD")
+            )
+
+    def send(self, msg: EmailMessage, recipients: list[str]):
+        if self._smtp is None:
+            self._connect()
+        with metrics.timer("smtp_send_seconds") as labels:
+            labels["outcome"] = "error"
+            try:
+                self._smtp.send_message(msg, to_addrs=recipients)
+            except smtplib.SMTPServerDisconnected:
+                self._connect()
+                self._smtp.send_message(msg, to_addrs=recipients)
+            labels["outcome"] = "ok"
+        metrics.inc("smtp_recipients_total", len(recipients))
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+
+class Outbox:
+    """
+    Collects a run's alerts and sends them over one SMTP connection.
+
+    Subscribers are loaded once, recipients go in BCC chunks of
+    SMTP_MAX_RECIPIENTS, and with `digest=True` all alerts are merged into a
+    single message. Chunks that fail transiently are stored in the
+    `email_outbox` table; `retry_queued()` sends them again, once per run,
+    claiming the rows first so concurrent workers never send the same one.
+    """
+
+    def __init__(self, digest: bool = ALERT_DIGEST):
+        self.digest = digest
+        self._alerts: list[tuple[str, object, str | None]] = []
+        self._subscribers: list[str] | None = None
+
+    def subscribers(self) -> list[str]:
+        if self._subscribers is None:
+            subs = get_supabase().table("email_subscribers").select("email").execute().data or []
+            self._subscribers = [s["email"] for s in subs]
+        return self._subscribers
+
+    def add(self, title, summary, url):
+        self._alerts.append((title, summary, url))
+
+    # ---------- message building ----------
+    def _messages(self) -> list[tuple[str, str, str]]:
+        """(subject, plain, html) for every message this flush should send."""
+        if not self._alerts:
+            return []
+        if not self.digest or len(self._alerts) == 1:
+            out = []
+            for title, summary, url in self._alerts:
+                plain, html = _format(summary, url)
+                out.append((f"🚨 NUSTIFY-SENTINEL Alert: {title}", plain, html))
+            return out
+
+        plain_parts, html_parts = [], []
+        for title, summary, url in self._alerts:
+            plain, html = _format(summary, url)
+            plain_parts.append(f"{title}\n{'-' * len(title)}\n{plain}")
+            html_parts.append(f"<h3>{html_lib.escape(title)}</h3>{html}")
+        subject = f"🚨 NUSTIFY-SENTINEL Digest: {len(self._alerts)} updates"
+        return [(subject, "\n\n".join(plain_parts), "<hr>".join(html_parts))]
+
+    @staticmethod
+    def _build(subject: str, plain: str, html: str) -> EmailMessage:
+        msg = EmailMessage()
+        msg["Subject"] = subject
+        msg["From"] = os.getenv("SENDER_EMAIL")
+        # Recipients are passed as envelope BCC only, never listed in headers
+        msg["To"] = os.getenv("SENDER_EMAIL")
+        msg.set_content(plain)
+        msg.add_alternative(html, subtype="html")
+        return msg
+
+    # ---------- persisted retry queue ----------
+    @staticmethod
+    def _claim_queued() -> list[dict]:
+        try:
+            return get_supabase().rpc("claim_email_outbox", {
+                "p_max_attempts": OUTBOX_MAX_ATTEMPTS, "p_ttl_s": OUTBOX_CLAIM_TTL_S,
+            }).execute().data or []
+        except Exception as e:
+            logger.error(f"[outbox] Could not claim queued emails: {e}")
+            return []
+
+    @staticmethod
+    def _enqueue(rows: list[dict]):
+        if not rows:
+            return
+        try:
+            get_supabase().table("email_outbox").insert(rows).execute()
+        except Exception as e:
+            logger.error(f"[outbox] Could not queue {len(rows)} emails for retry: {e}")
+
+    def retry_queued(self) -> dict:
+        """Send emails queued by earlier runs. Call once per run. Returns send counts."""
+        stats = {"sent": 0, "failed": 0}
+        rows = self._claim_queued()
+        if not rows:
+            return stats
+
+        session = _SmtpSession()
+        try:
+            for row in rows:
+                try:
+                    session.send(self._build(row["subject"], row["plain"], row["html"]), row["recipients"])
+                    get_supabase().table("email_outbox").delete().eq("id", row["id"]).execute()
+                    stats["sent"] += 1
+                except Exception as e:
+                    logger.error(f"[outbox] Retry of queued email {row['id']} failed: {e}")
+                    stats["failed"] += 1
+                    update = {"attempts": row["attempts"] + 1, "last_error": str(e)[:500], "claimed_until": None}
+                    if not _is_transient(e):
+                        update["attempts"] = OUTBOX_MAX_ATTEMPTS
+                    try:
+                        get_supabase().table("email_outbox").update(update).eq("id", row["id"]).execute()
+                    except Exception as db_error:
+                        # The claim expires, so the row is retried later anyway
+                        logger.error(f"[outbox] Could not update queued email {row['id']}: {db_error}")
+        finally:
+            session.close()
+        return stats
+
+    def flush(self) -> dict:
+        """Send the alerts added since the last flush. Returns send counts."""
+        stats = {"sent": 0, "queued": 0, "dropped": 0}
+        messages = self._messages()
+        recipients = self.subscribers() if messages else []
+        self._alerts = []
+        if not (messages and recipients):
+            return stats
+
+        session = _SmtpSession()
+        to_queue = []
+        try:
+            for subject, plain, html in messages:
+                msg = self._build(subject, plain, html)
+                for chunk in _chunks(recipients, SMTP_MAX_RECIPIENTS):
+                    try:
+                        session.send(msg, chunk)
+                        stats["sent"] += 1
+                    except Exception as e:
+                        if not _is_transient(e):
+                            logger.error(f"[outbox] Dropping '{subject}' for {len(chunk)} recipients: {e}")
+                            stats["dropped"] += 1
+                            continue
+                        logger.warning(f"[outbox] Queuing '{subject}' for retry: {e}")
+                        to_queue.append({
+                            "subject": subject, "plain": plain, "html": html,
+                            "recipients": chunk, "attempts": 1, "last_error": str(e)[:500],
+                        })
+        finally:
+            session.close()
+
+        self._enqueue(to_queue)
+        stats["queued"] = len(to_queue)
+        return stats
+
+
+def send_alert(title, summary, url):
+    """Send a single alert right away (one connection, BCC chunks)."""
+    outbox = Outbox(digest=False)
+    outbox.add(title, summary, url)
+    outbox.flush()
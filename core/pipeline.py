@@ -0,0 +1,518 @@
+import os
+import time
+import queue
+import logging
+import threading
+from datetime import datetime, timezone
+from core.scraper import fetch_page
+from core.fingerprint import page_fingerprint, stored_fingerprint, is_cosmetic
+from core.analyzer import llm_analyze_batch, BATCH_MAX_PAGES
+from core.db import fetch_by_ids, BatchWriter, WRITE_CHUNK
+from core.concurrency import run_bounded, host_of
+from core.hosts import HostProfiles
+from core.snapshots import get_snapshot_store
+from core.documents import DocumentIndex, DOCUMENTS_ENABLED, SECTION_HEADER, render_section, with_section, section_of, delete_documents
+from core import metrics, scheduler
+
+logger = logging.getLogger(__name__)
+
+# Global and per-host caps on concurrent page fetches
+MAX_WORKERS = int(os.getenv("WORKER_CONCURRENCY", "8"))
+PER_HOST = int(os.getenv("WORKER_PER_HOST", "2"))
+# Items buffered between stages before the upstream stage blocks
+QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "32"))
+# How long a stage waits to fill a micro-batch before working on what it has
+BATCH_WAIT_S = float(os.getenv("PIPELINE_BATCH_WAIT_S", "2"))
+# Stop starting new fetches after this many seconds (0 = no limit)
+TIME_BUDGET_S = float(os.getenv("WORKER_TIME_BUDGET_S", "0"))
+
+# Everything a check needs up front; last_content is loaded lazily
+SOURCE_COLUMNS = (
+    "id, name, url, content_hash, simhash, numbers_hash, etag, last_modified, "
+    "raw_hash, normalizers, noise_patterns, simhash_threshold, "
+    "priority, change_rate, check_interval_s, next_due_at, region_selector, region_applied"
+)
+
+_DONE = object()
+
+
+def _schedule_row(s, schedule):
+    """
+    Page record update with only the schedule columns (see core.scheduler).
+    Name and URL are never written back: the dashboard may edit them mid-run.
+    """
+    return {"id": s["id"], **schedule}
+
+
+def _touch_row(s, fetched, schedule):
+    """Page record update for a page whose stored content stays as is."""
+    return {
+        **_schedule_row(s, schedule),
+        "etag": fetched["etag"],
+        "last_modified": fetched["last_modified"],
+        "raw_hash": fetched["raw_hash"],
+        "last_checked": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def _state_row(s, fetched, fp, schedule, in_snapshots=False):
+    """
+    Page record update that also stores the new content and fingerprint.
+    Content kept in the snapshot store is not duplicated in last_content.
+    """
+    return {
+        **_touch_row(s, fetched, schedule),
+        "last_content": None if in_snapshots else fetched["content"],
+        "content_hash": fp["hash"],
+        "simhash": fp["simhash"],
+        "numbers_hash": fp["numbers_hash"],
+        "region_applied": s.get("region_selector"),
+    }
+
+
+def _rescoped(s) -> bool:
+    """Whether the region selector changed since the stored content was extracted."""
+    return bool(s.get("content_hash")) and (s.get("region_selector") or None) != (s.get("region_applied") or None)
+
+
+def _store_snapshot(s, content) -> bool:
+    """
+    Keep the new version in the snapshot store; failures never stop the run.
+    Returns whether it was stored.
+    """
+    store = get_snapshot_store()
+    if not store:
+        return False
+    try:
+        with metrics.timer("snapshot_seconds", op="put"):
+            store.put(s["id"], content)
+        return True
+    except Exception as e:
+        print(f"⚠️ Could not store snapshot for {s['name']}: {e}")
+        return False
+
+
+def _previous_content(s, row) -> str | None:
+    """last_content, or the newest snapshot when the row no longer carries it."""
+    if row.get("last_content"):
+        return row["last_content"]
+    store = get_snapshot_store()
+    if not store:
+        return None
+    try:
+        with metrics.timer("snapshot_seconds", op="latest"):
+            return store.latest(s["id"])
+    except Exception as e:
+        print(f"⚠️ Could not load the last snapshot of {s['name']}: {e}")
+        return None
+
+
+def _drain(q: queue.Queue, max_items: int, wait_s: float) -> tuple[list, bool]:
+    """
+    Block for one item, then collect more until `max_items` or `wait_s`
+    elapses. Returns (items, done) where done means the stream ended.
+    """
+    first = q.get()
+    if first is _DONE:
+        return [], True
+    items = [first]
+    deadline = time.monotonic() + wait_s
+    while len(items) < max_items:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            item = q.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if item is _DONE:
+            return items, True
+        items.append(item)
+    return items, False
+
+
+class CheckPipeline:
+    """
+    scrape → fingerprint → analyze → persist, as concurrent stages.
+
+    Stages run on their own threads and are connected by bounded queues,
+    so a slow stage applies backpressure upstream instead of buffering the
+    whole run: fetching keeps going while earlier pages are analyzed and
+    written. Alerts are added to `outbox` once the page and change rows
+    they describe are stored; the caller decides when to flush.
+
+    Page rows are written first; change and document rows follow only for
+    pages update_pages actually updated, so a source deleted mid-run is
+    skipped instead of failing the run.
+
+    Every checked page is rescheduled (core.scheduler). With a time budget,
+    pages not yet fetched when it runs out are skipped and stay due.
+
+    Linked documents (core.documents) are checked right after each fetch
+    and listed in a LINKED_DOCUMENTS section of the content, so a new,
+    removed or changed file is a content change like any other, even when
+    the page itself answered 304.
+
+    `on_progress(page, outcome)` is called from the persist thread once per
+    page with outcome one of "failed", "skipped", "unchanged", "cosmetic",
+    "changed", "meaningful" or "llm_unavailable".
+    """
+
+    def __init__(self, outbox, max_workers: int = MAX_WORKERS, per_host: int = PER_HOST,
+                 queue_size: int = QUEUE_SIZE, batch_wait_s: float = BATCH_WAIT_S,
+                 time_budget_s: float = TIME_BUDGET_S, on_progress=None, hosts=None):
+        self.outbox = outbox
+        self.time_budget_s = time_budget_s
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.batch_wait_s = batch_wait_s
+        self.on_progress = on_progress
+        self.hosts = hosts or HostProfiles.load()
+        self.documents = None
+
+        self._fetched = queue.Queue(queue_size)
+        self._to_analyze = queue.Queue(queue_size)
+        self._to_persist = queue.Queue(queue_size)
+        self._errors = []
+        # Change and document rows and alerts per page id, held until the page row is written
+        self._held: dict = {}
+        # Alerts of written pages, queued once their change row is stored
+        self._unsent: dict = {}
+        self._write_errors = []
+
+        self.summary = {
+            "checked": [], "failed": [], "skipped": [], "meaningful": [], "llm_unavailable": [],
+        }
+
+    # ---------- stages ----------
+    def _fetch_stage(self, sources):
+        deadline = time.monotonic() + self.time_budget_s if self.time_budget_s else None
+
+        def fetch(s):
+            if deadline and time.monotonic() > deadline:
+                return {"status": "skipped"}
+            # A new region selector needs the body re-extracted even if the page is unchanged
+            rescoped = _rescoped(s)
+            fetched = fetch_page(
+                s["url"],
+                etag=None if rescoped else s.get("etag"),
+                last_modified=None if rescoped else s.get("last_modified"),
+                raw_hash=None if rescoped else s.get("raw_hash"),
+                strategy=self.hosts.strategy_for(s["url"]),
+                region=s.get("region_selector"),
+            )
+            return self._check_documents(s, fetched, deadline)
+
+        results = run_bounded(
+            sources,
+            fetch,
+            key=lambda s: host_of(s["url"]),
+            max_workers=self.max_workers,
+            per_key=self.per_host,
+        )
+        # put() blocks when downstream is behind, which pauses new fetches
+        for idx, (s, fetched, error) in enumerate(results, start=1):
+            print(f"🟢 Checked page {idx}/{len(sources)}: {s['name']} ({s['url']})")
+            if error:
+                print(f"⚠️ Error while fetching {s['name']}: {error}")
+                fetched = {"status": "failed"}
+            elif fetched["status"] != "skipped":
+                self.hosts.record(s["url"], fetched)
+            self._fetched.put((s, fetched))
+
+    def _check_documents(self, s, fetched, deadline=None):
+        """HEAD-check the page's linked files and fold the list into its content."""
+        if self.documents is None or fetched["status"] not in ("ok", "not_modified"):
+            return fetched
+        try:
+            check = self.documents.check(
+                s["id"], fetched.get("documents"),
+                verify=fetched.get("strategy") != "insecure", deadline=deadline,
+            )
+        except Exception as e:
+            logger.error(f"[pipeline] Document check failed for {s['url']}: {e}")
+            return fetched
+
+        fetched["document_check"] = check
+        section = render_section(check["docs"])
+        if fetched["status"] == "ok":
+            fetched["content"] = with_section(fetched["content"], section)
+        elif check["changed"]:
+            # The page is unchanged but one of its files is new, gone or different
+            fetched["documents_section"] = section
+        return fetched
+
+    def _fingerprint_stage(self):
+        done = False
+        while not done:
+            items, done = _drain(self._fetched, QUEUE_SIZE, 0.2)
+            candidates = []
+            for s, fetched in items:
+                if fetched["status"] in ("failed", "skipped"):
+                    self._to_persist.put((fetched["status"], s, fetched, None, None))
+                    continue
+
+                # Server said 304 or the raw bytes are identical: nothing to parse or compare
+                if fetched["status"] == "not_modified":
+                    if fetched.get("documents_section"):
+                        candidates.append((s, fetched, None))
+                    else:
+                        self._to_persist.put(("touch", s, fetched, None, None))
+                    continue
+
+                fp = page_fingerprint(s, fetched["content"])
+                if _rescoped(s):
+                    # Old and new content cover different parts of the page: re-baseline, don't diff
+                    print(f"ℹ️ Region selector changed for {s['name']}, storing a new baseline.")
+                    self._to_persist.put(("state", s, fetched, fp, None))
+                    continue
+                if s.get("numbers_hash") and fp["hash"] == s["content_hash"]:
+                    self._to_persist.put(("touch", s, fetched, None, None))
+                    continue
+                candidates.append((s, fetched, fp))
+
+            if not candidates:
+                continue
+
+            # Load last_content only for pages whose fingerprint changed
+            old_contents = fetch_by_ids(
+                "monitored_pages", "id, last_content", [s["id"] for s, _, _ in candidates]
+            )
+            for s, fetched, fp in candidates:
+                s["last_content"] = _previous_content(s, old_contents.get(s["id"], {}))
+                old_fp = stored_fingerprint(s)
+                if fp is None:
+                    # Only the documents changed: new list on the stored text
+                    fetched["content"] = with_section(s["last_content"] or "", fetched["documents_section"])
+                    fp = page_fingerprint(s, fetched["content"])
+                elif self.documents is not None and s["last_content"] and SECTION_HEADER not in s["last_content"]:
+                    # Stored before documents were tracked: today's list is the baseline, not a change
+                    s["last_content"] = with_section(s["last_content"], section_of(fetched["content"]))
+                    old_fp = page_fingerprint(s, s["last_content"])
+                if old_fp and fp["hash"] == old_fp["hash"]:
+                    self._to_persist.put(("state", s, fetched, fp, None))
+                elif is_cosmetic(old_fp, fp, s.get("simhash_threshold")):
+                    self._to_persist.put(("cosmetic", s, fetched, fp, None))
+                else:
+                    print(f"🔍 Change detected for {s['name']}, queued for LLM analysis.")
+                    self._to_analyze.put((s, fetched, fp))
+
+    def _analyze_stage(self):
+        done = False
+        while not done:
+            # Micro-batches: several changed pages per LLM request
+            items, done = _drain(self._to_analyze, BATCH_MAX_PAGES * 2, self.batch_wait_s)
+            if not items:
+                continue
+            print(f"🔍 Analyzing {len(items)} changed pages with LLM...")
+            analyses = llm_analyze_batch([(s["last_content"], f["content"]) for s, f, _ in items])
+            for (s, fetched, fp), analysis in zip(items, analyses):
+                self._to_persist.put(("analyzed", s, fetched, fp, analysis))
+
+    def _persist_stage(self):
+        # Bulk writers; rows of one writer share the same columns
+        # Page rows are update-only, so a source deleted mid-run is not recreated
+        touch_writer = BatchWriter("monitored_pages", rpc="update_pages")
+        state_writer = BatchWriter("monitored_pages", rpc="update_pages")
+        retry_writer = BatchWriter("monitored_pages", rpc="update_pages")
+        changes_writer = BatchWriter("detected_changes")
+        documents_writer = BatchWriter("page_documents", on_conflict="page_id,url")
+        page_writers = (touch_writer, state_writer, retry_writer)
+
+        while True:
+            item = self._to_persist.get()
+            if item is _DONE:
+                break
+            kind, s, fetched, fp, analysis = item
+            outcome = self._persist(kind, s, fetched, fp, analysis, *page_writers)
+            metrics.inc("pages_total", outcome=outcome)
+            if self.on_progress:
+                try:
+                    self.on_progress(s, outcome)
+                except Exception as e:
+                    logger.error(f"[pipeline] Progress callback failed: {e}")
+            # After a failed write the rest waits for the final attempt
+            if not self._write_errors and sum(len(w.buffered) for w in page_writers) >= WRITE_CHUNK:
+                self._write(page_writers, changes_writer, documents_writer)
+
+        self._write(page_writers, changes_writer, documents_writer)
+        if self._held or self._unsent:
+            # Not stored, so the next run finds these changes again and alerts then
+            logger.error(f"[pipeline] Dropped the rows and alerts of {len(self._held) + len(self._unsent)} pages "
+                         f"that could not be written")
+            self._held.clear()
+            self._unsent.clear()
+        if self._write_errors:
+            raise self._write_errors[0]
+        print(f"🔹 Updated {sum(w.written for w in page_writers)} page records, "
+              f"stored {changes_writer.written} changes.")
+
+    def _flush(self, writer):
+        try:
+            writer.flush()
+        except Exception as e:
+            logger.error(f"[pipeline] Could not write {writer.table} rows: {e}")
+            self._write_errors.append(e)
+
+    def _hold(self, page_id, kind, item):
+        """Keep a change or document row or an alert back until its page row is written (see _write)."""
+        self._held.setdefault(page_id, {"changes": [], "documents": [], "alerts": []})[kind].append(item)
+
+    def _write(self, page_writers, changes_writer, documents_writer):
+        """
+        Write the buffered page rows first, then the held rows of the pages
+        update_pages actually updated, then queue the alerts whose change
+        rows were stored. Held rows of a page it skipped (the source was
+        deleted mid-run) are dropped instead of failing the foreign key;
+        those of a page whose write failed stay held.
+        """
+        written = set()
+        for writer in page_writers:
+            self._flush(writer)
+            written.update(writer.returned)
+        buffered = {row["id"] for writer in page_writers for row in writer.buffered}
+
+        for page_id in list(self._held):
+            if page_id in written:
+                held = self._held.pop(page_id)
+                for row in held["changes"]:
+                    changes_writer.add(row)
+                for row in held["documents"]:
+                    documents_writer.add(row)
+                if held["alerts"]:
+                    self._unsent[page_id] = held["alerts"]
+            elif page_id not in buffered:
+                logger.warning(f"[pipeline] Page {page_id} no longer exists, dropping its rows and alerts")
+                self._held.pop(page_id)
+
+        self._flush(changes_writer)
+        self._flush(documents_writer)
+        for row in changes_writer.returned:
+            for alert in self._unsent.pop(row["page_id"], []):
+                self.outbox.add(*alert)
+
+    def _persist(self, kind, s, fetched, fp, analysis, touch_writer, state_writer, retry_writer) -> str:
+        if kind == "skipped":
+            self.summary["skipped"].append(s["name"])
+            return "skipped"
+
+        if kind == "failed":
+            print(f"⚠️ Failed to fetch content for {s['name']}, skipping.")
+            self.summary["failed"].append(s["name"])
+            # A gone page backs off like a quiet one; anything else is retried soon
+            if fetched.get("error") == "permanent":
+                schedule = scheduler.reschedule(s, changed=False)
+            else:
+                schedule = scheduler.retry_later(s)
+            retry_writer.add(_schedule_row(s, schedule))
+            return "failed"
+
+        self.summary["checked"].append(s["name"])
+
+        if kind == "touch":
+            print(f"ℹ️ No change detected for {s['name']}.")
+            touch_writer.add(_touch_row(s, fetched, scheduler.reschedule(s, changed=False)))
+            self._persist_documents(s, fetched)
+            return "unchanged"
+
+        if kind in ("state", "cosmetic"):
+            if kind == "cosmetic":
+                print(f"ℹ️ Only cosmetic changes for {s['name']}, skipping LLM.")
+            stored = _store_snapshot(s, fetched["content"])
+            state_writer.add(_state_row(s, fetched, fp, scheduler.reschedule(s, changed=False), stored))
+            self._persist_documents(s, fetched)
+            return "unchanged" if kind == "state" else "cosmetic"
+
+        if analysis is None:
+            # Keep the old hash so the change is analyzed again next run
+            print(f"⚠️ LLM unavailable for {s['name']}, will retry next run.")
+            self.summary["llm_unavailable"].append(s["name"])
+            return "llm_unavailable"
+
+        outcome = "changed"
+        # Only consider pages with meaningful changes
+        if analysis.get("is_meaningful"):
+            print(f"✅ Meaningful change detected for {s['name']}. Queuing alert...")
+            summary = analysis["summary"]
+            if isinstance(summary, list):
+                summary = "\n".join(f"• {x}" for x in summary)
+
+            self._hold(s["id"], "changes", {
+                "page_id": s["id"],
+                "title": s["name"],
+                "summary": summary,
+                "is_meaningful": True,
+                "url": s["url"]
+            })
+            self._hold(s["id"], "alerts", (s["name"], analysis["summary"], s["url"]))
+            self.summary["meaningful"].append(s["name"])
+            outcome = "meaningful"
+        else:
+            print(f"ℹ️ Change detected for {s['name']}, but not meaningful.")
+
+        stored = _store_snapshot(s, fetched["content"])
+        state_writer.add(_state_row(s, fetched, fp, scheduler.reschedule(s, changed=True), stored))
+        self._persist_documents(s, fetched)
+        return outcome
+
+    def _persist_documents(self, s, fetched):
+        """
+        Store the page's document index. Called only alongside the page row,
+        so a change the LLM could not analyze is detected again next run.
+        """
+        check = fetched.get("document_check")
+        if not check:
+            return
+        for doc in check["rows"]:
+            self._hold(s["id"], "documents", doc)
+        if check["removed"]:
+            delete_documents(s["id"], check["removed"])
+        self.documents.commit(s["id"], check["docs"], check["removed"])
+
+    # ---------- driver ----------
+    def _stage(self, name, target, downstream, *args):
+        """Run a stage; always close the downstream queue, remember crashes."""
+        def run():
+            try:
+                with metrics.timer("pipeline_stage_seconds", stage=name):
+                    target(*args)
+            except Exception as e:
+                logger.exception(f"[pipeline] Stage {name} crashed")
+                self._errors.append((name, e))
+                # Keep upstream from blocking forever on a dead consumer
+                self._abandon(name)
+            finally:
+                if downstream is not None:
+                    downstream.put(_DONE)
+        return threading.Thread(target=run, name=f"pipeline-{name}", daemon=True)
+
+    def _abandon(self, name):
+        upstream = {
+            "fingerprint": self._fetched,
+            "analyze": self._to_analyze,
+            "persist": self._to_persist,
+        }.get(name)
+        if upstream is None:
+            return
+        threading.Thread(target=lambda: [None for _ in iter(upstream.get, _DONE)], daemon=True).start()
+
+    def run(self, sources: list) -> dict:
+        """Check every source; returns the run summary once all stages finish."""
+        if DOCUMENTS_ENABLED:
+            self.documents = DocumentIndex.load([s["id"] for s in sources])
+        threads = [
+            self._stage("fetch", self._fetch_stage, self._fetched, sources),
+            self._stage("fingerprint", self._fingerprint_stage, self._to_analyze),
+            self._stage("analyze", self._analyze_stage, self._to_persist),
+            self._stage("persist", self._persist_stage, None),
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.hosts.save()
+        if self._errors:
+            name, error = self._errors[0]
+            raise RuntimeError(f"Pipeline stage '{name}' failed: {error}") from error
+        return self.summary
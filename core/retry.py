@@ -0,0 +1,139 @@
+import os
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+# Fetch attempts per strategy and backoff bounds between them
+FETCH_MAX_ATTEMPTS = int(os.getenv("FETCH_MAX_ATTEMPTS", "3"))
+FETCH_BACKOFF_BASE_S = float(os.getenv("FETCH_BACKOFF_BASE_S", "2"))
+FETCH_BACKOFF_MAX_S = float(os.getenv("FETCH_BACKOFF_MAX_S", "30"))
+# Give up instead of honouring a Retry-After longer than this
+FETCH_MAX_RETRY_AFTER_S = float(os.getenv("FETCH_MAX_RETRY_AFTER_S", "120"))
+# Consecutive "host down" fetches before a host is skipped, and for how long
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "2"))
+BREAKER_COOLDOWN_S = float(os.getenv("BREAKER_COOLDOWN_S", "1800"))
+
+# Failure classes
+PERMANENT = "permanent"   # the page is gone: 404/410, no point trying anything else
+TRANSIENT = "transient"   # timeouts, connection errors, 408/425/429/5xx: retry
+SSL = "ssl"               # certificate problems: try the unverified fallback
+OTHER = "other"           # blocked or unusable response: retrying won't help, next strategy might
+
+PERMANENT_STATUSES = {404, 410}
+TRANSIENT_STATUSES = {408, 425, 429, 500, 502, 503, 504, 520, 521, 522, 523, 524}
+
+
+def classify_status(status: int) -> str | None:
+    """None for a usable response (200/304), else the failure class."""
+    if status in (200, 304):
+        return None
+    if status in PERMANENT_STATUSES:
+        return PERMANENT
+    if status in TRANSIENT_STATUSES:
+        return TRANSIENT
+    return OTHER
+
+
+def classify_exception(e: Exception) -> str:
+    text = str(e)
+    if "SSLError" in text or "certificate verify failed" in text or "check_hostname" in text:
+        return SSL
+    return TRANSIENT
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter that honours server retry hints."""
+
+    def __init__(self, max_attempts: int = FETCH_MAX_ATTEMPTS, base_s: float = FETCH_BACKOFF_BASE_S,
+                 max_s: float = FETCH_BACKOFF_MAX_S, max_retry_after_s: float = FETCH_MAX_RETRY_AFTER_S):
+        self.max_attempts = max(1, max_attempts)
+        self.base_s = base_s
+        self.max_s = max_s
+        self.max_retry_after_s = max_retry_after_s
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float | None:
+        """
+        Seconds to sleep before retry number `attempt + 1`, or None when the
+        server asks for a longer wait than we are willing to give.
+        """
+        if retry_after is not None:
+            if retry_after > self.max_retry_after_s:
+                return None
+            return retry_after + random.uniform(0, self.base_s)
+        return random.uniform(0, min(self.max_s, self.base_s * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Per-host breaker: after `failures` consecutive "host down" fetches the
+    host is skipped until `cooldown_s` has passed, then one probe is let
+    through (half-open). Any answer from the host closes it again, another
+    "host down" re-opens it; a probe that reports neither within
+    `cooldown_s` is given up on, so the host is never blocked for good.
+    """
+
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown_s: float = BREAKER_COOLDOWN_S):
+        self.failures = max(1, failures)
+        self.cooldown_s = cooldown_s
+        self._lock = threading.Lock()
+        self._state: dict[str, dict] = {}
+
+    def allow(self, host: str) -> bool:
+        with self._lock:
+            state = self._state.get(host)
+            if not state or state["open_until"] is None:
+                return True
+            if time.monotonic() < state["open_until"]:
+                return False
+            if state["probing"] and time.monotonic() < state["probing"] + self.cooldown_s:
+                return False
+            state["probing"] = time.monotonic()
+            return True
+
+    def record_success(self, host: str):
+        with self._lock:
+            self._state.pop(host, None)
+
+    def record_failure(self, host: str) -> bool:
+        """Count a failure; returns True if this opened the breaker."""
+        with self._lock:
+            state = self._state.setdefault(host, {"count": 0, "open_until": None, "probing": None})
+            state["count"] += 1
+            state["probing"] = None
+            if state["count"] >= self.failures:
+                opened = state["open_until"] is None or time.monotonic() >= state["open_until"]
+                state["open_until"] = time.monotonic() + self.cooldown_s
+                if opened:
+                    logger.warning(f"[breaker] {host} is down, skipping it for {self.cooldown_s:.0f}s")
+                return opened
+            return False
+
+
+_breaker: CircuitBreaker | None = None
+_breaker_lock = threading.Lock()
+
+
+def get_breaker() -> CircuitBreaker:
+    """Process-wide breaker, i.e. for the rest of a worker run."""
+    global _breaker
+    with _breaker_lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker()
+        return _breaker
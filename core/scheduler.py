@@ -0,0 +1,93 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+# Bounds on how often a page is checked
+MIN_INTERVAL_S = int(os.getenv("SCHED_MIN_INTERVAL_S", str(3600)))            # 1 hour
+# Defaults to the old daily cadence: quiet pages are never checked less often
+# than before, only busy or high-priority ones more often. Raise it once
+# priorities are set up.
+MAX_INTERVAL_S = int(os.getenv("SCHED_MAX_INTERVAL_S", str(24 * 3600)))       # 1 day
+DEFAULT_INTERVAL_S = int(os.getenv("SCHED_DEFAULT_INTERVAL_S", str(24 * 3600)))
+# Weight of the newest check in the change-rate moving average
+CHANGE_ALPHA = 0.3
+# Interval multipliers after a check with / without a change
+SHRINK = 0.5
+GROW = 1.5
+# Each priority step halves the longest allowed interval
+PRIORITY_STEP = 2
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _parse_ts(value) -> datetime | None:
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def _interval(page: dict) -> int:
+    return int(page.get("check_interval_s") or DEFAULT_INTERVAL_S)
+
+
+def max_interval(priority: int | None) -> int:
+    """Longest allowed interval for a priority; higher priority means more frequent checks."""
+    return max(MIN_INTERVAL_S, int(MAX_INTERVAL_S / PRIORITY_STEP ** max(0, priority or 0)))
+
+
+def is_due(page: dict, now: datetime | None = None) -> bool:
+    due = _parse_ts(page.get("next_due_at"))
+    return due is None or due <= (now or _now())
+
+
+def _urgency(page: dict, now: datetime) -> float:
+    """How overdue a page is, in multiples of its own interval; never-checked pages first."""
+    due = _parse_ts(page.get("next_due_at"))
+    if due is None:
+        return float("inf")
+    return (now - due).total_seconds() / _interval(page)
+
+
+def due_pages(pages: list[dict], now: datetime | None = None) -> list[dict]:
+    """Pages due for a check, highest priority first, then most overdue."""
+    now = now or _now()
+    due = [p for p in pages if is_due(p, now)]
+    due.sort(key=lambda p: (-(p.get("priority") or 0), -_urgency(p, now)))
+    return due
+
+
+def reschedule(page: dict, changed: bool, now: datetime | None = None) -> dict:
+    """
+    Schedule columns after a successful check.
+
+    The change rate is a moving average of "did this check find a change".
+    A change halves the interval; a quiet check grows it, more slowly for
+    pages that usually change, within [MIN_INTERVAL_S, max_interval(priority)].
+    """
+    now = now or _now()
+    rate = page.get("change_rate")
+    rate = float(changed) if rate is None else CHANGE_ALPHA * float(changed) + (1 - CHANGE_ALPHA) * rate
+
+    interval = _interval(page)
+    interval *= SHRINK if changed else 1 + (GROW - 1) * (1 - rate)
+    interval = int(min(max_interval(page.get("priority")), max(MIN_INTERVAL_S, interval)))
+
+    return {
+        "change_rate": round(rate, 4),
+        "check_interval_s": interval,
+        "next_due_at": (now + timedelta(seconds=interval)).isoformat(),
+    }
+
+
+def retry_later(page: dict, now: datetime | None = None) -> dict:
+    """Schedule columns after a failed fetch: keep the interval, try again soon."""
+    now = now or _now()
+    return {
+        "change_rate": page.get("change_rate"),
+        "check_interval_s": _interval(page),
+        "next_due_at": (now + timedelta(seconds=MIN_INTERVAL_S)).isoformat(),
+    }
@@ -1,139 +1,297 @@
 import time
 import logging
-import urllib3
-import cloudscraper
-import requests
-from trafilatura import extract
-from playwright.sync_api import sync_playwright
-from bs4 import BeautifulSoup
+import threading
+from core.utils import get_raw_hash
+from core.extract import extract_page
+from core.concurrency import host_of
+from core import metrics
+from core.retry import RetryPolicy, get_breaker, classify_status, classify_exception, parse_retry_after, PERMANENT, TRANSIENT, SSL
 
 logger = logging.getLogger(__name__)
 
-def _extract_supplemental_html(html: str) -> str:
+def _conditional_headers(etag: str | None, last_modified: str | None) -> dict:
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+def _result(status: str, content: str | None = None, etag: str | None = None,
+            last_modified: str | None = None, raw_hash: str | None = None,
+            documents: list[dict] | None = None) -> dict:
+    return {
+        "status": status,           # "ok" | "not_modified" | "failed"
+        "content": content,
+        "etag": etag,
+        "last_modified": last_modified,
+        "raw_hash": raw_hash,
+        "documents": documents,     # linked files found on the page (core.documents); None if not parsed
+        "strategy": None,           # rung of the fetch ladder that produced this
+        "latency_ms": None,
+        "error": None,              # failure class from core.retry when status is "failed"
+        "short_circuited": False,   # failed without a request: the breaker has the host marked down
+    }
+
+
+def _handle_response(res, url: str, prev_raw_hash: str | None,
+                     prev_etag: str | None, prev_last_modified: str | None,
+                     region: str | None = None) -> dict | None:
     """
-    Extract small, high-signal HTML snippets that trafilatura may drop.
-    Returns a compact string (NOT full HTML).
+    Turn an HTTP response into a fetch result.
+    Returns None when the response is unusable and the caller should move on.
     """
-    soup = BeautifulSoup(html, "lxml")
+    metrics.inc("http_responses_total", status=res.status_code)
+    etag = res.headers.get("ETag") or prev_etag
+    last_modified = res.headers.get("Last-Modified") or prev_last_modified
 
-    snippets = []
+    if res.status_code == 304:
+        return _result("not_modified", etag=etag, last_modified=last_modified, raw_hash=prev_raw_hash)
 
-    # Headings (often contain notices)
-    for tag in soup.find_all(["h1", "h2", "h3", "h4"]):
-        text = tag.get_text(strip=True)
-        if len(text) > 20:
-            snippets.append(f"[HEADING] {text}")
+    if res.status_code != 200:
+        logger.warning(f"[fetch] Status {res.status_code} for {url}")
+        return None
 
-    # Tables (dates, schedules)
-    for table in soup.find_all("table"):
-        table_text = table.get_text(" ", strip=True)
-        if len(table_text) > 50:
-            snippets.append(f"[TABLE] {table_text[:800]}")
+    # Identical bytes to the last run: skip extraction entirely
+    raw_hash = get_raw_hash(res.content)
+    if prev_raw_hash and raw_hash == prev_raw_hash:
+        return _result("not_modified", etag=etag, last_modified=last_modified, raw_hash=raw_hash)
 
-    # Strong / emphasized notices
-    for tag in soup.find_all(["strong", "b"]):
-        text = tag.get_text(strip=True)
-        if len(text) > 20:
-            snippets.append(f"[NOTICE] {text}")
+    content, documents = extract_page(res.text, min_length=500, region=region, base_url=getattr(res, "url", None) or url)
+    if content:
+        return _result(
+            "ok",
+            content=content,
+            etag=etag,
+            last_modified=last_modified,
+            raw_hash=raw_hash,
+            documents=documents,
+        )
+    return None
 
-    return "\n".join(snippets[:10])  # hard cap to avoid noise
 
+def _failed(error: str | None) -> dict:
+    result = _result("failed")
+    result["error"] = error
+    return result
 
-def scrape_page(url: str) -> str | None:
-    retries = 3
-    timeout = 25
 
-    scraper = cloudscraper.create_scraper(
-        browser={'browser': 'chrome', 'platform': 'windows', 'desktop': True}
-    )
+# Fetch strategies, cheapest first
+STRATEGIES = ("cloudscraper", "insecure", "playwright")
 
-    # ---------- Phase 1: cloudscraper ----------
-    for attempt in range(retries):
-        try:
-            res = scraper.get(url, timeout=timeout, verify=True)
+_local = threading.local()
 
-            if res.status_code == 200:
-                main_text = extract(res.text)
-                supplemental = _extract_supplemental_html(res.text)
 
-                if main_text and len(main_text) > 500:
-                    return (
-                        "PRIMARY_CONTENT:\n"
-                        + main_text
-                        + "\n\nSUPPLEMENTAL_SNIPPETS:\n"
-                        + supplemental
-                    )
+def _get_scraper():
+    """One cloudscraper session per thread, reused across pages of a run."""
+    scraper = getattr(_local, "scraper", None)
+    if scraper is None:
+        import cloudscraper
+        scraper = cloudscraper.create_scraper(
+            browser={'browser': 'chrome', 'platform': 'windows', 'desktop': True}
+        )
+        _local.scraper = scraper
+    return scraper
 
-            else:
-                logger.warning(f"[cloudscraper] Status {res.status_code} for {url}")
 
+def _fetch_cloudscraper(url: str, v: dict, retries: int | None = None,
+                        timeout: int = 25) -> tuple[dict | None, str | None]:
+    """
+    Returns (result, failure class from core.retry). Only transient
+    failures are retried, with jittered backoff that honours Retry-After;
+    SSL, permanent and unusable responses return at once.
+    """
+    scraper = _get_scraper()
+    policy = RetryPolicy(max_attempts=retries) if retries else RetryPolicy()
+
+    for attempt in range(policy.max_attempts):
+        retry_after = None
+        try:
+            res = scraper.get(url, timeout=timeout, verify=True, headers=v["headers"])
         except Exception as e:
-            is_ssl_error = (
-                "SSLError" in str(e)
-                or "certificate verify failed" in str(e)
-                or "check_hostname" in str(e)
-            )
+            kind = classify_exception(e)
+            if kind == SSL:
+                logger.warning(f"[cloudscraper] SSL error for {url}: {e}")
+                return None, SSL
+            logger.error(f"[cloudscraper] Error for {url}: {e}")
+        else:
+            kind = classify_status(res.status_code)
+            if kind is None:
+                result = _handle_response(res, url, v["raw_hash"], v["etag"], v["last_modified"], v["region"])
+                # The same bytes would come back on a retry; let the next strategy try
+                return (result, None) if result else (None, "unusable")
+            logger.warning(f"[cloudscraper] Status {res.status_code} for {url}")
+            metrics.inc("http_responses_total", status=res.status_code)
+            if kind != TRANSIENT:
+                return None, kind
+            retry_after = parse_retry_after(res.headers.get("Retry-After"))
 
-            if is_ssl_error:
-                try:
-                    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-                    logger.warning(f"[SSL fallback] Retrying without verification: {url}")
-
-                    res = requests.get(
-                        url,
-                        timeout=timeout,
-                        verify=False,
-                        headers={
-                            "User-Agent": (
-                                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                                "Chrome/120.0.0.0 Safari/537.36"
-                            )
-                        },
-                    )
-
-                    if res.status_code == 200:
-                        main_text = extract(res.text)
-                        supplemental = _extract_supplemental_html(res.text)
-
-                        if main_text and len(main_text) > 500:
-                            return (
-                                "PRIMARY_CONTENT:\n"
-                                + main_text
-                                + "\n\nSUPPLEMENTAL_SNIPPETS:\n"
-                                + supplemental
-                            )
-
-                except Exception as ssl_e:
-                    logger.error(f"[fallback-requests] Failed for {url}: {ssl_e}")
+        if attempt < policy.max_attempts - 1:
+            delay = policy.delay(attempt, retry_after)
+            if delay is None:
+                logger.warning(f"[cloudscraper] {url} asked to retry after {retry_after:.0f}s, giving up for this run")
+                break
+            metrics.inc("fetch_retries_total", strategy="cloudscraper")
+            metrics.inc("fetch_backoff_seconds_total", delay)
+            time.sleep(delay)
 
-            logger.error(f"[cloudscraper] Error for {url}: {e}")
+    return None, TRANSIENT
 
-        if attempt < retries - 1:
-            time.sleep(15)
 
-    # ---------- Phase 2: Playwright ----------
+def _fetch_insecure(url: str, v: dict, timeout: int = 25) -> dict | None:
+    import urllib3
+    import requests
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            page.goto(url, wait_until="networkidle", timeout=60000)
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        logger.warning(f"[SSL fallback] Requesting without verification: {url}")
+
+        res = requests.get(
+            url,
+            timeout=timeout,
+            verify=False,
+            headers={
+                "User-Agent": (
+                    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                    "AppleWebKit/537.36 (KHTML, like Gecko) "
+                    "Chrome/120.0.0.0 Safari/537.36"
+                ),
+                **v["headers"],
+            },
+        )
+        return _handle_response(res, url, v["raw_hash"], v["etag"], v["last_modified"], v["region"])
+
+    except Exception as e:
+        logger.error(f"[fallback-requests] Failed for {url}: {e}")
+        return None
 
-            html = page.content()
-            main_text = extract(html)
-            supplemental = _extract_supplemental_html(html)
 
-            browser.close()
+def _fetch_playwright(url: str, v: dict) -> dict | None:
+    from core.browser import get_browser_pool
+    try:
+        html = get_browser_pool().render(url, timeout_ms=60000)
 
-            if main_text and len(main_text) > 200:
-                return (
-                    "PRIMARY_CONTENT:\n"
-                    + main_text
-                    + "\n\nSUPPLEMENTAL_SNIPPETS:\n"
-                    + supplemental
-                )
+        # Rendered pages may change behind an unchanged HTML shell, so
+        # HTTP validators are dropped here and only the rendered hash is kept.
+        rendered_hash = get_raw_hash(html)
+        if v["raw_hash"] and rendered_hash == v["raw_hash"]:
+            return _result("not_modified", raw_hash=rendered_hash)
+
+        content, documents = extract_page(html, min_length=200, region=v["region"], base_url=url)
+        if content:
+            return _result(
+                "ok",
+                content=content,
+                raw_hash=rendered_hash,
+                documents=documents,
+            )
 
     except Exception as e:
         logger.error(f"[playwright] Failed for {url}: {e}")
 
     return None
+
+
+def _run_strategy(strategy: str, url: str, v: dict, retries: int) -> tuple[dict | None, str | None]:
+    """
+    Run one rung of the ladder and tag the result with strategy and latency.
+    Returns (result, failure class); only cloudscraper classifies failures.
+    """
+    started = time.monotonic()
+    failure = None
+    with metrics.timer("fetch_seconds", strategy=strategy, host=host_of(url)) as labels:
+        if strategy == "cloudscraper":
+            result, failure = _fetch_cloudscraper(url, v, retries=retries)
+        elif strategy == "insecure":
+            result = _fetch_insecure(url, v)
+        else:
+            result = _fetch_playwright(url, v)
+        labels["outcome"] = result["status"] if result else (failure or "failed")
+
+    if result:
+        result["strategy"] = strategy
+        result["latency_ms"] = int((time.monotonic() - started) * 1000)
+    return result, failure
+
+
+def fetch_page(url: str, etag: str | None = None, last_modified: str | None = None,
+               raw_hash: str | None = None, strategy: str | None = None,
+               region: str | None = None) -> dict:
+    """
+    Fetch and extract a page, reusing validators from the previous run.
+
+    `etag`/`last_modified` are sent as If-None-Match/If-Modified-Since and
+    `raw_hash` is compared against the body before any parsing. When either
+    says nothing changed the result has status "not_modified" and no content.
+
+    `strategy` is the rung that last worked for this host (see core.hosts).
+    It is tried first, once and without sleeps; only if it fails is the
+    full cloudscraper -> SSL fallback -> Playwright ladder walked.
+
+    Pages that are gone (404/410) fail without further strategies. Transient
+    failures (timeouts, 5xx, 429) still get the browser; hosts where even
+    that keeps failing are skipped by a circuit breaker (core.retry).
+
+    `region` is the page's CSS/XPath selector; see core.extract.extract_page.
+    """
+    host = host_of(url)
+    breaker = get_breaker()
+    if not breaker.allow(host):
+        metrics.inc("fetch_short_circuited_total")
+        logger.warning(f"[fetch] Skipping {url}: {host} is marked down for this run")
+        result = _failed(TRANSIENT)
+        result["short_circuited"] = True
+        return result
+
+    v = {
+        "etag": etag,
+        "last_modified": last_modified,
+        "raw_hash": raw_hash,
+        "headers": _conditional_headers(etag, last_modified),
+        "region": region,
+    }
+    ladder = list(STRATEGIES)
+
+    if strategy in ladder and strategy != "cloudscraper":
+        result, _ = _run_strategy(strategy, url, v, retries=1)
+        if result:
+            breaker.record_success(host)
+            return result
+        logger.warning(f"[fetch] Remembered strategy '{strategy}' failed for {url}, walking the ladder")
+        ladder.remove(strategy)
+
+    # ---------- Phase 1: cloudscraper, SSL fallback on certificate errors ----------
+    result, failure = _run_strategy("cloudscraper", url, v, retries=None)
+    if result:
+        breaker.record_success(host)
+        return result
+    if failure == PERMANENT:
+        # The host answered, the page is gone: nothing else will find it
+        breaker.record_success(host)
+        return _failed(PERMANENT)
+    if failure == SSL and "insecure" in ladder:
+        result, _ = _run_strategy("insecure", url, v, retries=1)
+        if result:
+            breaker.record_success(host)
+            return result
+
+    # ---------- Phase 2: Playwright (shared browser pool) ----------
+    # Also after exhausted 5xx/429 retries: WAF fronts often let a real browser through
+    if "playwright" in ladder:
+        result, _ = _run_strategy("playwright", url, v, retries=1)
+        if result:
+            breaker.record_success(host)
+            return result
+
+    if failure == TRANSIENT:
+        if breaker.record_failure(host):
+            metrics.inc("breaker_opened_total")
+    else:
+        # Blocked, unusable or a certificate problem: the host answered, so it is up
+        breaker.record_success(host)
+    return _failed(failure)
+
+
+def scrape_page(url: str) -> str | None:
+    """Unconditionally fetch a page and return its extracted content."""
+    return fetch_page(url)["content"]
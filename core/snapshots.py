@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import zlib
+import base64
+import sqlite3
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from difflib import SequenceMatcher
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_BACKEND = os.getenv("SNAPSHOT_BACKEND", "supabase")  # "supabase" | "local" | "off"
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", ".cache/snapshots.sqlite3")
+# Versions kept per page, and max delta chain length before a full copy is stored
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "50"))
+SNAPSHOT_KEYFRAME = int(os.getenv("SNAPSHOT_KEYFRAME", "10"))
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+# ---------- delta encoding ----------
+def make_delta(base: str, target: str) -> list:
+    """
+    Line-level delta: [i1, i2] copies base lines i1:i2, a list of strings
+    inserts those lines.
+    """
+    a = base.splitlines(keepends=True)
+    b = target.splitlines(keepends=True)
+    ops = []
+    for op, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if op == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(b[j1:j2])
+    return ops
+
+
+def apply_delta(base: str, ops: list) -> str:
+    a = base.splitlines(keepends=True)
+    out = []
+    for op in ops:
+        if len(op) == 2 and all(isinstance(x, int) for x in op):
+            out.extend(a[op[0]:op[1]])
+        else:
+            out.extend(op)
+    return "".join(out)
+
+
+class SnapshotStore(ABC):
+    """
+    Content-addressed, compressed page versions with change history.
+
+    Each distinct content is stored once as a blob keyed by its sha256,
+    either zlib-compressed in full or as a compressed line delta against
+    the page's previous version (a full copy every SNAPSHOT_KEYFRAME
+    versions bounds the chain). Each page keeps its last SNAPSHOT_KEEP
+    versions; blobs nothing refers to any more are deleted.
+
+    Subclasses provide storage for two record types:
+    blobs    {hash, encoding, base, depth, data (bytes), size, stored_size}
+    versions {id, page_id, hash, created_at}
+
+    Blobs never change once written, so decoded contents are cached by hash.
+    """
+
+    CACHE_SIZE = 64
+
+    def __init__(self, keep: int = SNAPSHOT_KEEP, keyframe: int = SNAPSHOT_KEYFRAME):
+        self.keep = keep
+        self.keyframe = keyframe
+        self._cache: OrderedDict[str, tuple[dict, str]] = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    # ---------- backend hooks ----------
+    @abstractmethod
+    def _chain(self, h: str) -> list[dict]:
+        """Blobs from `h` down to its full keyframe, newest first; [] if unknown."""
+
+    @abstractmethod
+    def _versions(self, page_id, limit: int | None = None) -> list[dict]:
+        """Newest-first versions of a page."""
+
+    @abstractmethod
+    def _commit(self, page_id, h: str, blob: dict):
+        """
+        In one transaction: store `blob` unless its hash exists, make `h`
+        the page's newest version, drop versions beyond `keep` and delete
+        blobs no version or delta refers to any more.
+        """
+
+    # ---------- public API ----------
+    def _load(self, h: str) -> tuple[dict | None, str | None]:
+        """(blob, content) for a hash, rebuilding delta chains as needed."""
+        with self._cache_lock:
+            if h in self._cache:
+                self._cache.move_to_end(h)
+                return self._cache[h]
+        chain = self._chain(h)
+        if not chain or chain[-1]["encoding"] != "full":
+            return None, None
+        content = zlib.decompress(chain[-1]["data"]).decode("utf-8")
+        for delta in reversed(chain[:-1]):
+            content = apply_delta(content, json.loads(zlib.decompress(delta["data"])))
+        return self._remember(chain[0], content)
+
+    def _remember(self, blob: dict, content: str) -> tuple[dict, str]:
+        meta = {k: v for k, v in blob.items() if k != "data"}
+        with self._cache_lock:
+            self._cache[blob["hash"]] = (meta, content)
+            while len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return meta, content
+
+    def get(self, h: str) -> str | None:
+        """Content for a hash."""
+        return self._load(h)[1]
+
+    def latest(self, page_id) -> str | None:
+        versions = self._versions(page_id, limit=1)
+        return self.get(versions[0]["hash"]) if versions else None
+
+    def history(self, page_id, limit: int | None = None) -> list[dict]:
+        """Newest-first [{hash, created_at}] for a page."""
+        return [
+            {"hash": v["hash"], "created_at": v["created_at"]}
+            for v in self._versions(page_id, limit=limit)
+        ]
+
+    def put(self, page_id, content: str) -> str:
+        """Record `content` as the page's newest version. Returns its hash."""
+        h = content_hash(content)
+        latest = self._versions(page_id, limit=1)
+        if latest and latest[0]["hash"] == h:
+            return h
+        blob = self._encode(h, content, latest[0]["hash"] if latest else None)
+        self._commit(page_id, h, blob)
+        self._remember(blob, content)
+        return h
+
+    def _encode(self, h: str, content: str, base_hash: str | None) -> dict:
+        raw = content.encode("utf-8")
+        full = zlib.compress(raw, 9)
+        blob = {
+            "hash": h, "encoding": "full", "base": None, "depth": 0,
+            "data": full, "size": len(raw), "stored_size": len(full),
+        }
+
+        base, base_content = self._load(base_hash) if base_hash else (None, None)
+        if base is None or base["depth"] + 1 >= self.keyframe:
+            return blob
+        delta = zlib.compress(json.dumps(make_delta(base_content, content)).encode("utf-8"), 9)
+        if len(delta) < len(full):
+            blob.update(encoding="delta", base=base_hash, depth=base["depth"] + 1,
+                        data=delta, stored_size=len(delta))
+        return blob
+
+
+class LocalSnapshotStore(SnapshotStore):
+    """SQLite-backed store for local runs and offline use."""
+
+    def __init__(self, path: str = SNAPSHOT_PATH, **kwargs):
+        super().__init__(**kwargs)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript("""
+            create table if not exists snapshot_blobs (
+                hash text primary key, encoding text not null, base text,
+                depth integer not null, data blob not null,
+                size integer not null, stored_size integer not null
+            );
+            create index if not exists snapshot_blobs_base on snapshot_blobs (base);
+            create table if not exists page_versions (
+                id integer primary key autoincrement, page_id text not null,
+                hash text not null, created_at real not null
+            );
+            create index if not exists page_versions_page on page_versions (page_id, id);
+            create index if not exists page_versions_hash on page_versions (hash);
+        """)
+
+    def _query(self, sql: str, args=()) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+            self._conn.commit()
+        return [dict(r) for r in rows]
+
+    def _chain(self, h):
+        chain = []
+        while h:
+            rows = self._query("select * from snapshot_blobs where hash = ?", (h,))
+            if not rows:
+                return []
+            chain.append(rows[0])
+            h = rows[0]["base"]
+        return chain
+
+    def _versions(self, page_id, limit=None):
+        sql = "select id, hash, created_at from page_versions where page_id = ? order by id desc"
+        if limit:
+            sql += f" limit {int(limit)}"
+        return self._query(sql, (str(page_id),))
+
+    def _commit(self, page_id, h, blob):
+        page_id = str(page_id)
+        with self._lock, self._conn:
+            c = self._conn
+            c.execute(
+                "insert or ignore into snapshot_blobs values (:hash, :encoding, :base, :depth, :data, :size, :stored_size)",
+                blob,
+            )
+            latest = c.execute(
+                "select hash from page_versions where page_id = ? order by id desc limit 1", (page_id,)
+            ).fetchone()
+            if not latest or latest[0] != h:
+                c.execute(
+                    "insert into page_versions (page_id, hash, created_at) values (?, ?, ?)",
+                    (page_id, h, time.time()),
+                )
+            old = c.execute(
+                "select id, hash from page_versions where page_id = ? order by id desc limit -1 offset ?",
+                (page_id, self.keep),
+            ).fetchall()
+            if not old:
+                return
+            c.execute(f"delete from page_versions where id in ({','.join('?' * len(old))})", [r[0] for r in old])
+            # Delete unreferenced blobs, then walk up to bases they kept alive
+            for dropped in {r[1] for r in old}:
+                while dropped:
+                    in_use = c.execute(
+                        "select 1 from page_versions where hash = ? union all "
+                        "select 1 from snapshot_blobs where base = ? limit 1", (dropped, dropped)
+                    ).fetchone()
+                    row = c.execute("select base from snapshot_blobs where hash = ?", (dropped,)).fetchone()
+                    if in_use or row is None:
+                        break
+                    c.execute("delete from snapshot_blobs where hash = ?", (dropped,))
+                    dropped = row[0]
+
+
+class SupabaseSnapshotStore(SnapshotStore):
+    """
+    Store backed by the snapshot_blobs / page_versions tables (data as
+    base64). Chains are read and versions committed through the
+    snapshot_chain / snapshot_put functions, one round trip each.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        from core.db import get_supabase
+        self._db = get_supabase()
+
+    def _chain(self, h):
+        rows = self._db.rpc("snapshot_chain", {"p_hash": h}).execute().data or []
+        for blob in rows:
+            blob["data"] = base64.b64decode(blob["data"])
+        return rows
+
+    def _versions(self, page_id, limit=None):
+        query = self._db.table("page_versions").select("id, hash, created_at").eq(
+            "page_id", page_id
+        ).order("id", desc=True)
+        if limit:
+            query = query.limit(limit)
+        return query.execute().data or []
+
+    def _commit(self, page_id, h, blob):
+        row = {**blob, "data": base64.b64encode(blob["data"]).decode("ascii")}
+        self._db.rpc(
+            "snapshot_put", {"p_page_id": page_id, "p_hash": h, "p_blob": row, "p_keep": self.keep}
+        ).execute()
+
+
+_store: SnapshotStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_snapshot_store() -> SnapshotStore | None:
+    """Process-wide store chosen by SNAPSHOT_BACKEND; None when disabled."""
+    global _store
+    with _store_lock:
+        if _store is None and SNAPSHOT_BACKEND != "off":
+            _store = LocalSnapshotStore() if SNAPSHOT_BACKEND == "local" else SupabaseSnapshotStore()
+        return _store
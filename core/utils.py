@@ -5,3 +5,12 @@ def get_text_hash(text: str) -> str:
         return ""
     clean = "".join(text.split()).lower()
     return hashlib.sha256(clean.encode()).hexdigest()
+
+
+def get_raw_hash(data: bytes | str) -> str:
+    """Cheap fingerprint of a raw response body, used to skip re-parsing identical bytes."""
+    if not data:
+        return ""
+    if isinstance(data, str):
+        data = data.encode("utf-8", errors="replace")
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
@@ -0,0 +1,5 @@
+-- HTTP validators and raw body hash used for conditional GETs
+alter table monitored_pages
+    add column if not exists etag text,
+    add column if not exists last_modified text,
+    add column if not exists raw_hash text;
@@ -0,0 +1,9 @@
+-- Per-host memory of the fetch strategy that last worked
+create table if not exists host_profiles (
+    host text primary key,
+    strategy text,
+    ssl_ok boolean,
+    latency_ms integer,
+    failures integer not null default 0,
+    updated_at timestamptz not null default now()
+);
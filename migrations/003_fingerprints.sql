@@ -0,0 +1,10 @@
+-- Noise-tolerant fingerprints; content_hash now hashes the normalized text
+alter table monitored_pages
+    add column if not exists simhash text,
+    add column if not exists numbers_hash text,
+    -- names from core.fingerprint.NORMALIZERS; null means the defaults
+    add column if not exists normalizers text[],
+    -- extra regexes whose matches are ignored for this page
+    add column if not exists noise_patterns text[],
+    -- max SimHash distance treated as cosmetic; null uses SIMHASH_THRESHOLD
+    add column if not exists simhash_threshold integer;
@@ -0,0 +1,11 @@
+-- Emails that failed transiently, retried on the next run
+create table if not exists email_outbox (
+    id bigint generated always as identity primary key,
+    subject text not null,
+    plain text not null,
+    html text not null,
+    recipients text[] not null,
+    attempts integer not null default 0,
+    last_error text,
+    created_at timestamptz not null default now()
+);
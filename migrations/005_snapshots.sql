@@ -0,0 +1,20 @@
+-- Content-addressed, compressed page versions (see core/snapshots.py)
+create table if not exists snapshot_blobs (
+    hash text primary key,
+    encoding text not null,          -- 'full' | 'delta'
+    base text references snapshot_blobs (hash),
+    depth integer not null,
+    data text not null,              -- base64 of zlib-compressed content or delta
+    size integer not null,
+    stored_size integer not null
+);
+create index if not exists snapshot_blobs_base on snapshot_blobs (base);
+
+create table if not exists page_versions (
+    id bigint generated always as identity primary key,
+    page_id bigint not null references monitored_pages (id) on delete cascade,
+    hash text not null references snapshot_blobs (hash),
+    created_at timestamptz not null default now()
+);
+create index if not exists page_versions_page on page_versions (page_id, id desc);
+create index if not exists page_versions_hash on page_versions (hash);
@@ -0,0 +1,11 @@
+-- Adaptive per-page scheduling (core.scheduler)
+alter table monitored_pages
+    -- higher is checked more often; each step halves the longest interval
+    add column if not exists priority integer not null default 0,
+    -- moving average of "this check found a change", 0..1
+    add column if not exists change_rate double precision,
+    add column if not exists check_interval_s integer,
+    -- null means never checked: due immediately
+    add column if not exists next_due_at timestamptz;
+
+create index if not exists monitored_pages_next_due_at on monitored_pages (next_due_at);
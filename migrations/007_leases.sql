@@ -0,0 +1,24 @@
+-- Page leases, so several workers can split the source list (core/leases.py)
+alter table monitored_pages
+    add column if not exists lease_owner text,
+    add column if not exists lease_expires_at timestamptz;
+
+-- Atomically lease the candidates that are still due and not held by
+-- another worker; returns the ids granted. Rows locked by a concurrent
+-- claim are skipped rather than waited for.
+create or replace function claim_pages(p_owner text, p_ids bigint[], p_ttl_s integer)
+returns setof bigint
+language sql
+as $$
+    update monitored_pages
+    set lease_owner = p_owner,
+        lease_expires_at = now() + make_interval(secs => p_ttl_s)
+    where id in (
+        select id from monitored_pages
+        where id = any (p_ids)
+          and (next_due_at is null or next_due_at <= now())
+          and (lease_owner is null or lease_owner = p_owner or lease_expires_at < now())
+        for update skip locked
+    )
+    returning id;
+$$;
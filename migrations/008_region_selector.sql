@@ -0,0 +1,6 @@
+-- Optional per-page extraction scope (core.extract.extract_content):
+-- a CSS selector, or XPath when prefixed with "xpath:" or starting with "/".
+-- Null or no match means the whole document. After changing it, clear
+-- raw_hash/etag so the next run re-extracts an unchanged page.
+alter table monitored_pages
+    add column if not exists region_selector text;
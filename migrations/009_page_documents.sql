@@ -0,0 +1,15 @@
+-- Files linked from monitored pages (core/documents.py): merit lists, fee
+-- challans, datesheets. HEAD signals decide whether a file is downloaded
+-- again; content_hash covers at most DOC_MAX_BYTES of it.
+create table if not exists page_documents (
+    id bigint generated always as identity primary key,
+    page_id bigint not null references monitored_pages (id) on delete cascade,
+    url text not null,
+    title text,
+    etag text,
+    last_modified text,
+    content_length bigint,
+    content_hash text,
+    first_seen_at timestamptz not null default now(),
+    unique (page_id, url)
+);
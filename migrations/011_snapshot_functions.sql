@@ -0,0 +1,57 @@
+-- One round trip per snapshot read and write (core/snapshots.py)
+
+-- A blob and the bases it is a delta against, newest first
+create or replace function snapshot_chain(p_hash text)
+returns setof snapshot_blobs
+language sql
+stable
+as $$
+    with recursive chain as (
+        select b.*, 0 as step from snapshot_blobs b where b.hash = p_hash
+        union all
+        select b.*, c.step + 1 from snapshot_blobs b join chain c on b.hash = c.base
+    )
+    select hash, encoding, base, depth, data, size, stored_size from chain order by step;
+$$;
+
+-- Store a blob, make it the page's newest version, apply retention and
+-- delete blobs that neither a version nor another delta refers to
+create or replace function snapshot_put(p_page_id bigint, p_hash text, p_blob jsonb, p_keep integer)
+returns void
+language plpgsql
+as $$
+declare
+    dropped text[];
+begin
+    insert into snapshot_blobs (hash, encoding, base, depth, data, size, stored_size)
+    select hash, encoding, base, depth, data, size, stored_size
+    from jsonb_populate_record(null::snapshot_blobs, p_blob)
+    on conflict (hash) do nothing;
+
+    if (select v.hash from page_versions v where v.page_id = p_page_id order by v.id desc limit 1)
+       is distinct from p_hash then
+        insert into page_versions (page_id, hash) values (p_page_id, p_hash);
+    end if;
+
+    with old as (
+        delete from page_versions
+        where page_id = p_page_id
+          and id not in (
+              select v.id from page_versions v where v.page_id = p_page_id order by v.id desc limit p_keep
+          )
+        returning hash
+    )
+    select array_agg(distinct hash) into dropped from old;
+
+    while dropped is not null loop
+        with gone as (
+            delete from snapshot_blobs b
+            where b.hash = any (dropped)
+              and not exists (select 1 from page_versions v where v.hash = b.hash)
+              and not exists (select 1 from snapshot_blobs c where c.base = b.hash)
+            returning b.base
+        )
+        select array_agg(distinct base) filter (where base is not null) into dropped from gone;
+    end loop;
+end;
+$$;
@@ -0,0 +1,20 @@
+-- claim_pages gains p_due_only: the dashboard's manual scan leases pages
+-- whether or not they are due, but still never one another worker holds
+drop function if exists claim_pages(text, bigint[], integer);
+
+create or replace function claim_pages(p_owner text, p_ids bigint[], p_ttl_s integer, p_due_only boolean default true)
+returns setof bigint
+language sql
+as $$
+    update monitored_pages
+    set lease_owner = p_owner,
+        lease_expires_at = now() + make_interval(secs => p_ttl_s)
+    where id in (
+        select id from monitored_pages
+        where id = any (p_ids)
+          and (not p_due_only or next_due_at is null or next_due_at <= now())
+          and (lease_owner is null or lease_owner = p_owner or lease_expires_at < now())
+        for update skip locked
+    )
+    returning id;
+$$;
@@ -0,0 +1,33 @@
+-- The region selector the stored content was extracted with. When it
+-- differs from region_selector the pipeline ignores the validators,
+-- re-extracts and stores a new baseline without analysis, so editing the
+-- selector no longer needs raw_hash/etag cleared by hand (migration 008).
+alter table monitored_pages
+    add column if not exists region_applied text;
+
+-- Existing pages with a selector are re-baselined once on their next check,
+-- since their stored content may predate the selector
+
+-- update_pages (migration 010) also writes region_applied
+create or replace function update_pages(p_rows jsonb)
+returns setof bigint
+language sql
+as $$
+    update monitored_pages p
+    set etag = case when r.value ? 'etag' then n.etag else p.etag end,
+        last_modified = case when r.value ? 'last_modified' then n.last_modified else p.last_modified end,
+        raw_hash = case when r.value ? 'raw_hash' then n.raw_hash else p.raw_hash end,
+        last_checked = case when r.value ? 'last_checked' then n.last_checked else p.last_checked end,
+        last_content = case when r.value ? 'last_content' then n.last_content else p.last_content end,
+        content_hash = case when r.value ? 'content_hash' then n.content_hash else p.content_hash end,
+        simhash = case when r.value ? 'simhash' then n.simhash else p.simhash end,
+        numbers_hash = case when r.value ? 'numbers_hash' then n.numbers_hash else p.numbers_hash end,
+        change_rate = case when r.value ? 'change_rate' then n.change_rate else p.change_rate end,
+        check_interval_s = case when r.value ? 'check_interval_s' then n.check_interval_s else p.check_interval_s end,
+        next_due_at = case when r.value ? 'next_due_at' then n.next_due_at else p.next_due_at end,
+        region_applied = case when r.value ? 'region_applied' then n.region_applied else p.region_applied end
+    from jsonb_array_elements(p_rows) r,
+         lateral jsonb_populate_record(null::monitored_pages, r.value) n
+    where p.id = n.id
+    returning p.id;
+$$;
@@ -0,0 +1,10 @@
+-- Back-off for linked documents (core/documents.py), with the same rules as
+-- pages (core.scheduler): links that are gone (404/410) and files without
+-- any HEAD signal are not fetched again until next_due_at.
+alter table page_documents
+    add column if not exists change_rate double precision,
+    add column if not exists check_interval_s integer,
+    -- null means probe on every check of the page
+    add column if not exists next_due_at timestamptz,
+    -- consecutive failed probes; reset by the next successful one
+    add column if not exists failures integer not null default 0;
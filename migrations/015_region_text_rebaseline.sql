@@ -0,0 +1,6 @@
+-- Region text is now one line per block element instead of one per text
+-- node (core/extract.py). Clearing region_applied re-baselines every scoped
+-- page once, silently, instead of reporting the new line layout as a change.
+update monitored_pages
+set region_applied = null
+where region_selector is not null;
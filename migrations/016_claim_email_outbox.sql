@@ -0,0 +1,22 @@
+-- Queued emails (migration 004) are claimed before they are retried, so
+-- concurrent workers (matrix shards, the summary job, the dashboard) never
+-- send the same one twice. A claim expires, so a crashed worker's emails
+-- are retried by a later run.
+alter table email_outbox
+    add column if not exists claimed_until timestamptz;
+
+create or replace function claim_email_outbox(p_max_attempts integer, p_ttl_s integer)
+returns setof email_outbox
+language sql
+as $$
+    update email_outbox
+    set claimed_until = now() + make_interval(secs => p_ttl_s)
+    where id in (
+        select id from email_outbox
+        where attempts < p_max_attempts
+          and (claimed_until is null or claimed_until < now())
+        order by id
+        for update skip locked
+    )
+    returning *;
+$$;
@@ -1,71 +1,152 @@
-from core.scraper import scrape_page
-from core.utils import get_text_hash
-from core.analyzer import llm_analyze_change
-from core.notifier import send_alert
-from core.db import supabase
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from core.notifier import Outbox
+from core.db import iter_rows, get_supabase
+from core.browser import close_browser_pool
+from core.hosts import HostProfiles
+from core.llm_cache import get_cache, close_cache
+from core.pipeline import CheckPipeline, SOURCE_COLUMNS, TIME_BUDGET_S
+from core.leases import get_lease_store, worker_id, in_shard, LEASE_BATCH, WORKER_SHARD, WORKER_SHARDS
+from core import metrics, scheduler
+
+# Send the "No changes detected" email from this run (set for the daily run only).
+# Sharded workers never send it themselves; `python worker.py summary` does, once all shards are done.
+NO_CHANGE_SUMMARY = os.getenv("SEND_NO_CHANGE_SUMMARY", "1") == "1"
+# How far back the summary looks for meaningful changes and checked pages
+NO_CHANGE_WINDOW_S = int(os.getenv("NO_CHANGE_WINDOW_S", str(24 * 3600)))
+
+def _batches(items: list, size: int):
+    for i in range(0, len(items), max(1, size)):
+        yield items[i:i + size]
 
 def job():
+    metrics.reset()
+    metrics.clear_report()
+    started = time.monotonic()
     print("🔹 Job started: fetching monitored pages from database...")
-    sources = supabase.table("monitored_pages").select("*").execute().data
-    print(f"🔹 {len(sources)} pages fetched for monitoring.\n")
-
-    pages_with_changes = []  # Collect pages that had meaningful changes
-    pages_checked = []       # Collect all page names for reference
-
-    for idx, s in enumerate(sources, start=1):
-        print(f"🟢 Checking page {idx}/{len(sources)}: {s['name']} ({s['url']})")
-        content = scrape_page(s["url"])
-        if not content:
-            print(f"⚠️ Failed to fetch content for {s['name']}, skipping.\n")
-            continue
-
-        pages_checked.append(s["name"])  # Track pages checked
-
-        new_hash = get_text_hash(content)
-        if new_hash != s["content_hash"]:
-            print(f"🔍 Change detected for {s['name']}, analyzing with LLM...")
-            analysis = llm_analyze_change(s["last_content"], content)
-
-            # Only consider pages with meaningful changes
-            if analysis.get("is_meaningful"):
-                print(f"✅ Meaningful change detected for {s['name']}. Sending alert...")
-                summary = analysis["summary"]
-                if isinstance(summary, list):
-                    summary = "\n".join(f"• {x}" for x in summary)
-
-                supabase.table("detected_changes").insert({
-                    "page_id": s["id"],
-                    "title": s["name"],
-                    "summary": summary,
-                    "is_meaningful": True,
-                    "url": s["url"]
-                }).execute()
-
-                # Send individual alert for meaningful change
-                send_alert(s["name"], analysis["summary"], s["url"])
-                pages_with_changes.append(s["name"])
-            else:
-                print(f"ℹ️ Change detected for {s['name']}, but not meaningful.\n")
-        else:
-            print(f"ℹ️ No change detected for {s['name']}.\n")
-
-        # Update the monitored page record
-        supabase.table("monitored_pages").update({
-            "last_content": content,
-            "content_hash": new_hash,
-            "last_checked": "now()"
-        }).eq("id", s["id"]).execute()
-        print(f"🔹 Updated record for {s['name']}.\n")
+    sources = list(iter_rows("monitored_pages", SOURCE_COLUMNS))
+    due = [s for s in scheduler.due_pages(sources) if in_shard(s)]
+    shard = f" (shard {WORKER_SHARD + 1}/{WORKER_SHARDS})" if WORKER_SHARDS > 1 else ""
+    print(f"🔹 {len(sources)} pages fetched for monitoring, {len(due)} due for a check{shard}.\n")
+
+    outbox = Outbox()  # Alerts are sent together at the end of the run
+    hosts = HostProfiles.load()
+    leases = get_lease_store()
+    owner = worker_id()
+    summary = {"checked": [], "failed": [], "skipped": [], "meaningful": [], "llm_unavailable": []}
+
+    # Claim and check due pages a batch at a time. Each batch is persisted
+    # before the next is claimed, so an interrupted run loses at most one
+    # batch, and its leases expire for the next run to pick up.
+    completed = False
+    try:
+        for batch in _batches(due, LEASE_BATCH):
+            remaining = TIME_BUDGET_S - (time.monotonic() - started) if TIME_BUDGET_S else 0
+            if TIME_BUDGET_S and remaining <= 0:
+                summary["skipped"] += [s["name"] for s in batch]
+                continue
+
+            if leases:
+                granted = leases.claim(owner, [s["id"] for s in batch])
+                if len(granted) < len(batch):
+                    print(f"🔒 {len(batch) - len(granted)} pages are leased by another worker or no longer due.")
+                batch = [s for s in batch if s["id"] in granted]
+            if not batch:
+                continue
+
+            try:
+                # Fetch, fingerprint, analyze and persist as overlapping stages
+                result = CheckPipeline(outbox, time_budget_s=remaining, hosts=hosts).run(batch)
+            finally:
+                if leases:
+                    leases.release(owner, [s["id"] for s in batch])
+            for key in summary:
+                summary[key] += result[key]
+            if not outbox.digest:
+                # Alerts for this batch are persisted; send them now
+                print(f"📧 Emails: {outbox.flush()}")
+        completed = True
+    finally:
+        # Alerts of changes stored before a crash are still sent (the
+        # pipeline only queues alerts whose rows were written), and the
+        # report always describes this run
+        _finish(outbox, summary, completed)
+
+def no_change_summary(outbox) -> bool:
+    """
+    Queue the "No changes detected" email if no worker stored a meaningful
+    change within NO_CHANGE_WINDOW_S. Reads the shared tables rather than
+    one worker's results, so every shard's findings count.
+    """
+    since = (datetime.now(timezone.utc) - timedelta(seconds=NO_CHANGE_WINDOW_S)).isoformat()
+    db = get_supabase()
+    changes = db.table("detected_changes").select("id").eq("is_meaningful", True).gte(
+        "timestamp", since
+    ).limit(1).execute().data
+    if changes:
+        return False
+    checked = db.table("monitored_pages").select("name").gte("last_checked", since).order("name").execute().data or []
+    if not checked:
+        return False
+    print("ℹ️ No meaningful changes detected for any monitored page. Sending summary email...")
+    summary_text = "No changes were detected for the following monitored pages:\n\n"
+    summary_text += "\n".join(f"• {r['name']}\n" for r in checked)
+    outbox.add("No changes detected", [summary_text], None)
+    return True
+
+def summary_job():
+    """Send the no-change summary for a sharded run, after every shard has finished."""
+    outbox = Outbox()
+    if not no_change_summary(outbox):
+        print("ℹ️ Meaningful changes were found (or nothing was checked); no summary sent.")
+    print(f"📧 Emails: {outbox.flush()}")
+
+def _finish(outbox, summary, completed):
+    if summary["skipped"]:
+        print(f"⏱️ Time budget used up, {len(summary['skipped'])} due pages left for the next run.")
+
+    cache = get_cache()
+    if cache:
+        print(f"💾 LLM cache: {cache.stats()}")
+    close_cache()
 
     # If no meaningful changes found, send a single “no changes” email
-    if not pages_with_changes and pages_checked:
+    if completed and NO_CHANGE_SUMMARY and WORKER_SHARDS <= 1 and not summary["meaningful"] and summary["checked"]:
         print("ℹ️ No meaningful changes detected for any monitored page. Sending summary email...")
         summary_text = "No changes were detected for the following monitored pages:\n\n"
-        summary_text += "\n".join(f"• {x}\n" for x in pages_checked)
-        send_alert("No changes detected", [summary_text], None)
-        print("✅ Summary email sent.\n")
+        summary_text += "\n".join(f"• {x}\n" for x in summary["checked"])
+        outbox.add("No changes detected", [summary_text], None)
+
+    # Sent after the pipeline has persisted, so every email has a matching feed entry
+    try:
+        print(f"📧 Emails: {outbox.flush()}")
+    except Exception as e:
+        print(f"⚠️ Could not send emails: {e}")
+    # Emails queued by earlier runs, once per run (rows are claimed, so shards don't overlap)
+    try:
+        print(f"📧 Queued emails retried: {outbox.retry_queued()}")
+    except Exception as e:
+        print(f"⚠️ Could not retry queued emails: {e}")
+
+    # Machine-readable timings and counters for this run
+    try:
+        report = metrics.write_report()
+    except Exception as e:
+        print(f"⚠️ Could not write the run report: {e}")
+    else:
+        print(f"📊 Run report written to {metrics.METRICS_JSON_PATH} and {metrics.METRICS_PROM_PATH}")
+        for h in report["slowest_hosts"][:3]:
+            print(f"🐢 {h['host']}: {h['fetch_s']}s fetching")
 
-    print("🔹 Job completed.")
+    print("🔹 Job completed." if completed else "❌ Job failed; alerts so far were sent.")
 
 if __name__ == "__main__":
-    job()
+    if sys.argv[1:] == ["summary"]:
+        summary_job()
+    else:
+        try:
+            job()
+        finally:
+            close_browser_pool()